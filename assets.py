@@ -0,0 +1,240 @@
+""" Image loading for PySweeper.
+
+Tiles are only decoded and scaled the first time they are
+used. The scaled set is then written to an on-disk cache,
+keyed by the tile size and the source files' modification
+times, so that later launches can skip both steps.
+"""
+
+from hashlib import sha1
+from os import path, makedirs, listdir, remove, environ
+from time import perf_counter
+
+from pygame import image, transform, display, Surface, Rect
+
+from board import HIDDEN
+
+
+# Colour of a plot that is neither revealed nor marked
+HIDDEN_COLOR = (100, 100, 100)
+
+CACHE_PATH = path.join(
+    environ.get('XDG_CACHE_HOME') or path.expanduser(path.join('~', '.cache')),
+    'pysweeper'
+)
+
+
+class Tile_Set():
+    """ Mapping of tile id to a plot_size x plot_size surface,
+    scaled from image_path/<id>.png. Loading happens on the
+    first lookup, or when load() is called.
+    For blitting, all tiles are also packed into a single
+    atlas surface, see atlas(), and scaled() gives one for
+    any other plot size.
+    """
+
+    def __init__(self, plot_size, image_path, quantity=15):
+        self.plot_size = plot_size
+        self.image_path = image_path
+        self.quantity = quantity
+
+        self.tiles = None
+
+        self._atlas = None
+        self._atlas_format = None
+        self.rects = self.__rects(plot_size)
+
+        # Atlases at other plot sizes, by size, built
+        # from the one atlas() last returned
+        self._scaled = {}
+        self._scaled_from = None
+
+        # Filled in by load(), for startup reports
+        self.cache_hit = False
+        self.load_time = 0.0
+
+
+    def __getitem__(self, tile):
+        if self.tiles is None:
+            self.load()
+
+        return self.tiles[tile]
+
+
+    def __len__(self):
+        return self.quantity
+
+
+    def atlas(self):
+        """ Return the atlas surface, with every tile side by
+        side and HIDDEN as a blank plot. Tile t is the area
+        rects[t] of it. The atlas is in the display's pixel
+        format, and is built again when the display mode
+        changes, so blits from it need no conversion.
+        """
+
+        screen = display.get_surface() if display.get_init() else None
+        screen_format = screen and (
+            id(screen), screen.get_bitsize(), screen.get_masks()
+        )
+
+        if self._atlas is None or screen_format != self._atlas_format:
+            self._atlas = self.__build_atlas(screen)
+            self._atlas_format = screen_format
+
+        return self._atlas
+
+
+    def scaled(self, plot_size):
+        """ Return the atlas and the rects of every tile
+        in it for plots of plot_size pixels.
+        """
+
+        atlas = self.atlas()
+
+        if plot_size == self.plot_size:
+            return atlas, self.rects
+
+        if self._scaled_from is not atlas:
+            self._scaled = {}
+            self._scaled_from = atlas
+
+        if plot_size not in self._scaled:
+            rects = self.__rects(plot_size)
+            scaled = Surface((plot_size * (HIDDEN + 1), plot_size))
+            scaled = scaled.convert(atlas)
+
+            # Tile by tile, so that tiles don't
+            # bleed into each other
+            for source, rect in zip(self.rects, rects):
+                scaled.blit(transform.smoothscale(
+                    atlas.subsurface(source), rect.size
+                ), rect)
+
+            self._scaled[plot_size] = (scaled, rects)
+
+        return self._scaled[plot_size]
+
+
+    @staticmethod
+    def __rects(plot_size):
+        return [
+            Rect(tile * plot_size, 0, plot_size, plot_size)
+            for tile in range(HIDDEN + 1)
+        ]
+
+
+    def __build_atlas(self, screen):
+        """ Pack all tiles into one surface, converted to
+        the format of screen if there is one.
+        """
+
+        if self.tiles is None:
+            self.load()
+
+        atlas = Surface((self.plot_size * (HIDDEN + 1), self.plot_size))
+
+        for tile, rect in enumerate(self.rects):
+            if tile == HIDDEN:
+                atlas.fill(HIDDEN_COLOR, rect)
+            else:
+                atlas.blit(self.tiles[tile], rect)
+
+        if screen is not None:
+            atlas = atlas.convert(screen)
+
+        return atlas
+
+
+    def _source(self, tile):
+        return path.join(self.image_path, '{}.png'.format(tile))
+
+
+    def _cache_file(self):
+        """ Return the cache file name for the current tile
+        size and source images.
+        """
+
+        key = sha1(str(self.plot_size).encode())
+
+        for tile in range(self.quantity):
+            key.update(str(path.getmtime(self._source(tile))).encode())
+
+        return path.join(
+            CACHE_PATH,
+            'tiles-{}-{}.rgb'.format(self.plot_size, key.hexdigest()[:16])
+        )
+
+
+    def load(self):
+        """ Load every tile, from the cache if it is up to
+        date, from the source images otherwise.
+        """
+
+        start = perf_counter()
+        cache_file = self._cache_file()
+
+        try:
+            self.tiles = self.__read_cache(cache_file)
+            self.cache_hit = True
+        except (OSError, ValueError):
+            self.tiles = self.__scale_sources()
+            self.cache_hit = False
+            self.__write_cache(cache_file)
+
+        self.load_time = perf_counter() - start
+
+
+    def __scale_sources(self):
+        """ Decode and scale all source images. """
+
+        size = (self.plot_size, self.plot_size)
+
+        return [
+            transform.smoothscale(image.load(self._source(tile)), size)
+            for tile in range(self.quantity)
+        ]
+
+
+    def __read_cache(self, cache_file):
+        """ Read all tiles from cache_file, raise OSError if
+        it is missing or ValueError if it is truncated.
+        """
+
+        size = (self.plot_size, self.plot_size)
+        tile_bytes = self.plot_size ** 2 * 3
+
+        with open(cache_file, 'rb') as cache:
+            data = cache.read()
+
+        if len(data) != tile_bytes * self.quantity:
+            raise ValueError('Tile cache has the wrong size')
+
+        return [
+            image.frombytes(
+                data[i * tile_bytes:(i + 1) * tile_bytes], size, 'RGB'
+            )
+            for i in range(self.quantity)
+        ]
+
+
+    def __write_cache(self, cache_file):
+        """ Write all tiles to cache_file, and drop stale
+        cache files for the same tile size. The cache is
+        only an optimisation, so failures are ignored.
+        """
+
+        prefix = 'tiles-{}-'.format(self.plot_size)
+
+        try:
+            makedirs(CACHE_PATH, exist_ok=True)
+
+            for name in listdir(CACHE_PATH):
+                if name.startswith(prefix):
+                    remove(path.join(CACHE_PATH, name))
+
+            with open(cache_file, 'wb') as cache:
+                for tile in self.tiles:
+                    cache.write(image.tobytes(tile, 'RGB'))
+        except OSError:
+            pass
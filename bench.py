@@ -0,0 +1,301 @@
+""" Benchmarks for PySweeper's engine and renderer hot paths.
+
+Runs headless (SDL's dummy video driver) on fixed seeds, over
+a sweep of board sizes, and writes the timings as JSON so
+that a later run can be compared against a stored baseline.
+
+USAGE:
+ - `python bench.py --output baseline.json`
+ - `python bench.py --baseline baseline.json` reports every
+   benchmark that got slower than the baseline, and exits
+   with status 1 if any did
+ - `python bench.py --help` for the other options
+"""
+
+from os import environ
+
+# Must be set before pygame is imported
+environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from argparse import ArgumentParser
+from json import dump, load
+from platform import platform, python_version
+from statistics import median, mean
+from time import perf_counter_ns
+import sys
+
+import numpy as np
+import pygame
+
+from engine import Engine
+
+
+DEFAULT_SIZES = (9, 16, 30, 64, 128, 500, 1000)
+
+# Largest window to benchmark in, bigger boards are
+# seen through the camera like on a real screen
+MAX_DISPLAY = 1024
+
+
+def import_frontend(plot_size):
+    """ Import obj, which takes its settings from const.
+    const reads the command line, so give it a board size
+    and the plot size to benchmark with.
+    """
+
+    argv = sys.argv
+    sys.argv = [argv[0], '--size', '9', '--plot-size', str(plot_size)]
+
+    try:
+        import obj
+    finally:
+        sys.argv = argv
+
+    return obj
+
+
+def fresh(engine, seed):
+    """ Deal the board of seed again on engine. """
+
+    engine.new_game(seed)
+    return engine
+
+
+def first_mine(engine):
+    """ Flat index of the first mined plot. """
+
+    return int(np.flatnonzero(engine.board.mines)[0])
+
+
+def first_opening(engine):
+    """ Flat index of the first safe plot with no mines
+    around it, where a click starts a cascade.
+    """
+
+    board = engine.board
+    openings = np.flatnonzero((board.adjacent == 0) & (board.mines == 0))
+
+    return int(openings[0]) if openings.size else 0
+
+
+def engine_benchmarks(side, seed):
+    """ Return the (name, setup, run) triples for the engine.
+    setup() prepares a run and returns the argument run()
+    is timed with.
+    """
+
+    engine = Engine(side, seed=seed)
+
+    def flagged(engine):
+        # Every mine flagged, a winning check_victory
+        board = engine.board
+        board.flags[:] = board.mines
+        engine.marked_mines = engine.mine_quantity
+        engine.recount()
+        return engine
+
+    return [
+        ('generate_mine_map',
+         lambda: engine, lambda engine: engine.new_game(seed)),
+        ('clear_area',
+         lambda: fresh(engine, seed),
+         lambda engine: engine.clear_area(first_mine(engine))),
+        ('reveal_cascade',
+         lambda: fresh(engine, seed),
+         lambda engine: engine.reveal_adjacent(first_opening(engine))),
+        ('reveal_all',
+         lambda: fresh(engine, seed), lambda engine: engine.reveal_all()),
+        ('check_victory',
+         lambda: flagged(fresh(engine, seed)),
+         lambda engine: engine.check_victory()),
+    ]
+
+
+def frontend_benchmarks(obj, side, seed):
+    """ Return the (name, setup, run) triples for the
+    pygame frontend, drawing to a dummy display.
+    """
+
+    step = obj.PLOT_SIZE + obj.PLOT_PADDING
+    size = min(MAX_DISPLAY, 2 * obj.TERRAIN_MARGIN + side * step)
+
+    terrain = obj.Terrain_Manager(side, seed=seed, screen_size=size)
+    display = pygame.display.set_mode((size, size))
+    manager = obj.Stat_Manager(size, terrain)
+
+    terrain.camera.look_at(side // 2, side // 2)
+    center = terrain.get_plot(side // 2, side // 2).rect.center
+
+    def frame(display):
+        display.fill(obj.BACKGROUND)
+        terrain.render_plots(display)
+        manager.render_statbar(display)
+
+    return [
+        ('generate_plots',
+         lambda: side,
+         lambda side: obj.Terrain_Manager(side, seed=seed, screen_size=size)),
+        # Right clicks go through the hit test and the
+        # engine, without ending the game
+        ('update_plots',
+         lambda: center,
+         lambda center: terrain.update_plots(False, True, center)),
+        ('frame', lambda: display, frame),
+    ]
+
+
+def measure(setup, run, repeat):
+    """ Time run(setup()) repeat times. Return the
+    timings in microseconds.
+    """
+
+    timings = []
+
+    for attempt in range(repeat):
+        argument = setup()
+        start = perf_counter_ns()
+        run(argument)
+        timings.append((perf_counter_ns() - start) / 1000)
+
+    return timings
+
+
+def run_benchmarks(sizes, seed, repeat, plot_size, only=None):
+    """ Run every benchmark (or those named in only) on every
+    size, and return the results as a JSON-ready dict.
+    """
+
+    pygame.init()
+    obj = import_frontend(plot_size)
+
+    results = []
+
+    for side in sizes:
+        benchmarks = (
+            engine_benchmarks(side, seed)
+            + frontend_benchmarks(obj, side, seed)
+        )
+
+        for name, setup, run in benchmarks:
+            if only and name not in only:
+                continue
+
+            # One untimed run, to warm caches up
+            run(setup())
+            timings = measure(setup, run, repeat)
+
+            results.append({
+                'name': name,
+                'size': side,
+                'min_us': min(timings),
+                'median_us': median(timings),
+                'mean_us': mean(timings),
+                'runs': repeat,
+            })
+
+    pygame.quit()
+
+    return {
+        'meta': {
+            'python': python_version(),
+            'numpy': np.__version__,
+            'pygame': pygame.version.ver,
+            'platform': platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'plot_size': plot_size,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """ Print how every benchmark in report compares with the
+    same one in baseline. Return the list of those whose
+    median got slower by more than tolerance (0.25 = 25%).
+    """
+
+    previous = {
+        (result['name'], result['size']): result['median_us']
+        for result in baseline['results']
+    }
+
+    slower = []
+
+    for result in report['results']:
+        key = (result['name'], result['size'])
+        if key not in previous:
+            continue
+
+        ratio = result['median_us'] / previous[key]
+        regressed = ratio > 1 + tolerance
+
+        print("{:<18} {:>4}  {:>10.1f} us  {:>6.2f}x{}".format(
+            result['name'], result['size'], result['median_us'], ratio,
+            '  SLOWER' if regressed else ''
+        ))
+
+        if regressed:
+            slower.append(key)
+
+    return slower
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        description="Benchmark PySweeper's engine and renderer"
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+        help="board sides to benchmark (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="seed of every board (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=15,
+        help="timed runs per benchmark (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--plot-size', type=int, default=16,
+        help="plot size to render with (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--only', nargs='+', metavar='NAME',
+        help="only run the benchmarks with these names"
+    )
+    parser.add_argument(
+        '-o', '--output', help="write the results to this JSON file"
+    )
+    parser.add_argument(
+        '--baseline', help="JSON results to compare against"
+    )
+    parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help="slowdown allowed before a benchmark counts as "
+        "a regression (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        args.sizes, args.seed, args.repeat, args.plot_size, args.only
+    )
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            slower = compare(report, load(baseline), args.tolerance)
+        return 1 if slower else 0
+
+    for result in report['results']:
+        print("{name:<18} {size:>4}  {median_us:>10.1f} us".format(**result))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+""" NumPy board core for PySweeper.
+
+The whole terrain is kept as a handful of 2-D arrays
+instead of being spread over Plot objects, so that whole
+board queries (generation, reveal_all, victory) are
+vectorized rather than Python loops.
+"""
+
+import numpy as np
+
+from topology import Topology
+
+
+# Tile ids, matching the images in res/img.
+# 0 to 8 are the adjacent mine counts
+FLAGGED = 9
+UNKNOWN = 10
+UNMARKED_MINE = 11
+WRONG_FLAG = 12
+MARKED_MINE = 13
+EXPLODED_MINE = 14
+# Plot that is neither revealed nor marked
+HIDDEN = 15
+
+# Most neighbours a plot may have, beyond that counts
+# would take the ids of the tiles above
+MAX_DEGREE = 8
+
+
+class Board():
+    """ Array backed terrain. Every array is indexed [y, x].
+     - mines: 1 if the plot holds a mine, 0 otherwise
+     - revealed: True once the plot has been revealed
+     - flags: 0 = unmarked, 1 = flagged, 2 = unknown
+     - adjacent: quantity of mines around each plot
+     - tiles: tile id each plot currently shows
+    changed holds the flat index of every plot whose reveal
+    or flag state changed since it was last emptied.
+    Adjacency is read from topology, a Topology instance
+    (the classic 3x3 neighbourhood by default), which may
+    give a plot at most MAX_DEGREE neighbours.
+    """
+
+    def __init__(self, terrain_side, topology=None):
+        self.terrain_side = terrain_side
+        self.plot_quantity = terrain_side ** 2
+
+        self.topology = topology or Topology(terrain_side)
+
+        if self.topology.max_degree > MAX_DEGREE:
+            raise ValueError(
+                'Plots can have at most {} neighbours'.format(MAX_DEGREE)
+            )
+
+        shape = (terrain_side, terrain_side)
+
+        self.mines = np.zeros(shape, dtype=np.uint8)
+        self.revealed = np.zeros(shape, dtype=bool)
+        self.flags = np.zeros(shape, dtype=np.uint8)
+        self.adjacent = np.zeros(shape, dtype=np.int16)
+        self.tiles = np.full(shape, HIDDEN, dtype=np.uint8)
+
+        self.changed = set()
+
+
+    def place_mines(self, indices):
+        """ Clear the board and put a mine on every
+        flat index in indices.
+        """
+
+        self.mines.fill(0)
+        self.revealed.fill(False)
+        self.flags.fill(0)
+        self.tiles.fill(HIDDEN)
+        self.changed.clear()
+
+        self.mines.ravel()[np.asarray(indices, dtype=np.intp)] = 1
+        self.update_adjacent()
+
+
+    def update_adjacent(self):
+        """ Recount adjacent mines for the whole board,
+        in one vectorized pass over the neighbour table.
+        """
+
+        self.adjacent.ravel()[:] = self.topology.count(self.mines.ravel())
+
+
+    def set_mine(self, x, y, value):
+        """ Add (1) or remove (0) the mine at x, y and update
+        the adjacent counts of its neighbourhood only.
+        """
+
+        if self.mines[y, x] == value:
+            return
+
+        self.mines[y, x] = value
+
+        neighbours = self.topology.neighbours_of(y * self.terrain_side + x)
+        self.adjacent.ravel()[neighbours] += 1 if value else -1
+
+
+    def reveal_tiles(self):
+        """ Return the tile id each plot shows once
+        the whole board is unveiled.
+        """
+
+        mined = self.mines == 1
+        flagged = self.flags == 1
+
+        tiles = self.adjacent.copy()
+        tiles[mined & (self.flags == 0)] = UNMARKED_MINE
+        tiles[mined & flagged] = MARKED_MINE
+        tiles[~mined & flagged] = WRONG_FLAG
+
+        return tiles
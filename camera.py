@@ -0,0 +1,233 @@
+""" Viewport camera for PySweeper.
+
+The board is laid out in a world of pixels, step pixels per
+plot, and the Camera shows the part of it that fits in a
+viewport on screen. It can scroll and zoom (through a set
+of plot sizes), tells which plots intersect the view so
+that only those are drawn, and turns screen pixels back
+into plots for clicks.
+Like engine, this module does not need pygame.
+"""
+
+
+def zoom_sizes(plot_size, smallest, ratio=1.25):
+    """ Return the plot sizes to zoom through: plot_size,
+    and sizes ratio apart from it, down to smallest and
+    up to twice plot_size.
+    """
+
+    sizes = {plot_size}
+
+    size = plot_size
+    while size / ratio >= smallest:
+        size /= ratio
+        sizes.add(round(size))
+
+    size = plot_size
+    while size * ratio <= 2 * plot_size:
+        size *= ratio
+        sizes.add(round(size))
+
+    return sorted(sizes)
+
+
+class Camera():
+    """ View of a board of terrain_side plots per side,
+    or of an endless one if terrain_side is None.
+     - viewport: (left, top, width, height) of the screen
+       area the board is shown in
+     - plot_size, padding: size of a plot and space between
+       plots at the base zoom level
+     - sizes: plot sizes to zoom through, as given by
+       zoom_sizes(). plot_size must be one of them.
+    x and y are the world pixel shown at the top left
+    of the viewport.
+    """
+
+    def __init__(self, terrain_side, viewport, plot_size, padding, sizes):
+        self.terrain_side = terrain_side
+        self.left, self.top, self.width, self.height = viewport
+
+        self.base_size = plot_size
+        self.base_padding = padding
+        self.sizes = sizes
+        self.level = sizes.index(plot_size)
+
+        self.x = 0
+        self.y = 0
+
+
+    @property
+    def plot_size(self):
+        return self.sizes[self.level]
+
+    @property
+    def padding(self):
+        # Padding shrinks and grows with the plots
+        return round(self.base_padding * self.plot_size / self.base_size)
+
+    @property
+    def step(self):
+        return self.plot_size + self.padding
+
+    @property
+    def world_size(self):
+        """ Side of the whole board, in pixels, or None
+        if it is endless.
+        """
+        if self.terrain_side is None:
+            return None
+        return self.terrain_side * self.step - self.padding
+
+
+    def clamp(self):
+        """ Keep the view over the board. """
+
+        if self.terrain_side is None:
+            return
+
+        self.x = max(0, min(self.x, self.world_size - self.width))
+        self.y = max(0, min(self.y, self.world_size - self.height))
+
+
+    def fit(self):
+        """ Zoom to the largest plot size, no larger than
+        the base one, at which the whole board fits in the
+        viewport. Keep the base size if none does.
+        """
+
+        base = self.sizes.index(self.base_size)
+
+        if self.terrain_side is None:
+            self.level = base
+            return
+
+        for level in range(base, -1, -1):
+            self.level = level
+            if self.world_size <= min(self.width, self.height):
+                break
+        else:
+            self.level = base
+
+        self.clamp()
+
+
+    def visible(self):
+        """ Return the x_offset and y_offset ranges of the
+        plots that intersect the viewport, as
+        (x_start, x_stop, y_start, y_stop).
+        """
+
+        step = self.step
+        x_stop = (self.x + self.width - 1) // step + 1
+        y_stop = (self.y + self.height - 1) // step + 1
+
+        if self.terrain_side is not None:
+            x_stop = min(self.terrain_side, x_stop)
+            y_stop = min(self.terrain_side, y_stop)
+
+        return self.x // step, x_stop, self.y // step, y_stop
+
+
+    def position(self, x_offset, y_offset):
+        """ Return the screen position of the top left
+        corner of the plot at x_offset, y_offset.
+        """
+
+        step = self.step
+
+        return (
+            self.left + x_offset * step - self.x,
+            self.top + y_offset * step - self.y
+        )
+
+
+    def is_visible(self, x_offset, y_offset):
+        """ True if the plot at x_offset, y_offset
+        intersects the viewport.
+        """
+
+        x, y = self.position(x_offset, y_offset)
+        size = self.plot_size
+
+        return (
+            x + size > self.left and x < self.left + self.width
+            and y + size > self.top and y < self.top + self.height
+        )
+
+
+    def plot_at(self, position):
+        """ Return the (x_offset, y_offset) of the plot under
+        the screen position, or None if it lands outside the
+        viewport, off the board or in the padding.
+        """
+
+        x = position[0] - self.left
+        y = position[1] - self.top
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+
+        x_offset, x_rest = divmod(x + self.x, self.step)
+        y_offset, y_rest = divmod(y + self.y, self.step)
+
+        if x_rest >= self.plot_size or y_rest >= self.plot_size:
+            return None
+
+        if self.terrain_side is not None and (
+            x_offset >= self.terrain_side or y_offset >= self.terrain_side
+        ):
+            return None
+
+        return x_offset, y_offset
+
+
+    def look_at(self, x_offset, y_offset):
+        """ Center the view on the plot at x_offset,
+        y_offset, as far as the board allows.
+        """
+
+        step = self.step
+        self.x = x_offset * step + self.plot_size // 2 - self.width // 2
+        self.y = y_offset * step + self.plot_size // 2 - self.height // 2
+        self.clamp()
+
+
+    def scroll(self, dx, dy):
+        """ Move the view by dx, dy pixels. Return
+        True if it moved.
+        """
+
+        view = (self.x, self.y)
+
+        self.x += dx
+        self.y += dy
+        self.clamp()
+
+        return (self.x, self.y) != view
+
+
+    def zoom(self, steps, position):
+        """ Zoom in by steps levels (out if negative), keeping
+        the world point under the screen position in place.
+        Return True if the zoom level changed.
+        """
+
+        level = max(0, min(len(self.sizes) - 1, self.level + steps))
+
+        if level == self.level:
+            return False
+
+        # Where position points to, in plots
+        x = position[0] - self.left
+        y = position[1] - self.top
+        plot_x = (self.x + x) / self.step
+        plot_y = (self.y + y) / self.step
+
+        self.level = level
+
+        self.x = round(plot_x * self.step - x)
+        self.y = round(plot_y * self.step - y)
+        self.clamp()
+
+        return True
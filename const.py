@@ -2,23 +2,99 @@
 You are free to edit (some of) these.
 """
 
-from os import path, system, name
+from os import path, environ
 
-from pygame import image, transform, display
+from pygame import display
 
-from function import request_size
+from assets import Tile_Set
+from function import load_config, request_size
+from snapshot import HEADER, read_header
+import replay
 
-# You can customize these
+# You can customize these. Board size, plot size and
+# padding can also be given on the command line or in
+# a config file, see `python main.py --help`
 
 PLOT_SIZE = 55
 PLOT_PADDING = 2
 
+# Terrain side bounds. Boards that don't fit on screen
+# are shown through a camera that scrolls and zooms
+MIN_SIDE = 9
+MAX_SIDE = 1000
+
+# Terrain side when none is given. With ASK_SIZE, the
+# game asks for one at startup instead
+DEFAULT_SIDE = 9
+ASK_SIZE = False
+
+# Smallest plot size the camera zooms out to, and how
+# far the arrow keys scroll, in plots
+MIN_PLOT_SIZE = 8
+SCROLL_PLOTS = 3
+
+# Only redraw the plots and text that changed each
+# frame, instead of the whole window
+DIRTY_RENDERING = True
+
+# Sleep until there is input instead of looping
+# continuously, waking up every CLOCK_REFRESH
+# milliseconds to update the clock
+IDLE_WAIT = True
+CLOCK_REFRESH = 250
+
+# Frame rate cap, 0 to run uncapped
+FRAMERATE = 60
+
+# Place mines on the first click, away from the clicked
+# plot, instead of moving them out of its way
+DEFER_MINES = False
+
+# Only deal boards that can be cleared from the first
+# click without guessing, giving up after NO_GUESS_TIMEOUT
+# seconds and dealing a normal board instead
+NO_GUESS = False
+NO_GUESS_TIMEOUT = 1.0
+
+# Also win once every safe plot is revealed, instead of
+# only once exactly the mines are flagged
+WIN_BY_REVEAL = False
+
+# Play on an endless board, split in chunks that are
+# generated as they are explored, ENDLESS_DENSITY being
+# the share of plots holding a mine
+ENDLESS = False
+ENDLESS_DENSITY = 0.16
+
+# Moves played per frame when the solver plays by itself
+AUTO_SOLVE_MOVES = 10
+
+# Record every game, and keep its replay once it ends
+RECORD_REPLAYS = True
+
+BACKGROUND = (10, 10, 10)
+
 
 ## Don't touch these
 
+CONFIG = load_config()
+
+PLOT_SIZE = CONFIG.get('plot_size', PLOT_SIZE)
+PLOT_PADDING = CONFIG.get('padding', PLOT_PADDING)
+
+# None picks a random seed and a classic mine density
+SEED = CONFIG.get('seed')
+MINE_QUANTITY = CONFIG.get('mines')
+NO_GUESS = CONFIG.get('no_guess', NO_GUESS)
+WIN_BY_REVEAL = CONFIG.get('win_by_reveal', WIN_BY_REVEAL)
+ENDLESS = CONFIG.get('endless', ENDLESS)
+ASK_SIZE = CONFIG.get('ask_size', ASK_SIZE)
+
 check = (
     PLOT_SIZE > 0,
     PLOT_PADDING >= 0,
+    CLOCK_REFRESH > 0,
+    FRAMERATE >= 0,
 )
 
 try:
@@ -33,35 +109,74 @@ RESOURCE_PATH = path.join(ROOT_PATH, 'res')
 IMAGE_PATH = path.join(RESOURCE_PATH, 'img')
 FONT_PATH = path.join(RESOURCE_PATH, 'sfm.otf')
 
-# Image preloading
+ICON_PATH = path.join(IMAGE_PATH, 'icon.png')
 
-PLOT_TILES = {}
+# Saved games: F5 saves to SAVE_FILE and F9 loads it back.
+# The game in progress is also kept in RECOVERY_FILE after
+# every click, so that it survives a crash
+DATA_PATH = path.join(
+    environ.get('XDG_DATA_HOME')
+    or path.expanduser(path.join('~', '.local', 'share')),
+    'pysweeper'
+)
+SAVE_FILE = path.join(DATA_PATH, 'save.psw')
+RECOVERY_FILE = path.join(DATA_PATH, 'recovery.psw')
 
-for number in range(15):
-    pil = image.load
-    pis = transform.smoothscale
+# Replays of finished games are written here
+REPLAY_PATH = path.join(DATA_PATH, 'replays')
 
-    PLOT_TILES[number] = pis(
-        pil(path.join(IMAGE_PATH, '{}.png'.format(number))),
-        (PLOT_SIZE, PLOT_SIZE)
-    )
+# F4 writes the recent frame timings here
+PROFILE_FILE = path.join(DATA_PATH, 'profile.json')
 
-ICON = image.load(path.join(IMAGE_PATH, 'icon.png'))
+# Images are loaded on first use, and cached
+# to disk once scaled
 
-# Clear png_read_image errors
-system('cls' if name == 'nt' else 'clear')
+PLOT_TILES = Tile_Set(PLOT_SIZE, IMAGE_PATH)
 
 
 # Size generation
 
-TERRAIN_SIDE = request_size(9, 64)
+TERRAIN_SIDE = None
+
+if ENDLESS:
+    # Endless boards have no size,
+    # use the largest window
+    TERRAIN_SIDE = MAX_SIDE
+elif 'replay' in CONFIG:
+    # The board has to match the replay
+    try:
+        with open(CONFIG['replay'], 'rb') as recorded:
+            TERRAIN_SIDE = replay.read_header(
+                recorded.read(replay.HEADER.size)
+            ).terrain_side
+    except (OSError, ValueError) as error:
+        print("Could not load {}: {}".format(CONFIG.pop('replay'), error))
+elif 'load' in CONFIG:
+    # The board has to match the saved game
+    try:
+        with open(CONFIG['load'], 'rb') as saved:
+            TERRAIN_SIDE = read_header(
+                saved.read(HEADER.size)
+            ).terrain_side
+    except (OSError, ValueError) as error:
+        print("Could not load {}: {}".format(CONFIG.pop('load'), error))
+
+if TERRAIN_SIDE is None:
+    TERRAIN_SIDE = CONFIG.get('size') or (
+        request_size(MIN_SIDE, MAX_SIDE) if ASK_SIZE else DEFAULT_SIDE
+    )
+
+if not MIN_SIDE <= TERRAIN_SIDE <= MAX_SIDE:
+    raise ValueError(
+        'Terrain size must be between {} and {}'.format(MIN_SIDE, MAX_SIDE)
+    )
 
 # Generate display size : PLOT_SIZE per plot
 # PLOT_PADDING between them
 # TERRAIN_MARGIN on each side
 SCREEN_SIZE = (
     (PLOT_SIZE * TERRAIN_SIDE)
-    + PLOT_PADDING * (TERRAIN_SIDE - 2)
+    + PLOT_PADDING * (TERRAIN_SIDE - 1)
 )
 
 TERRAIN_MARGIN = int(1 / 10 * SCREEN_SIZE)
@@ -74,12 +189,7 @@ SCREEN_SIZE += 2 * TERRAIN_MARGIN
 display.init()
 DISPLAY_HEIGHT = display.Info().current_h
 
-# Check and warn user if SCREEN_SIZE
-# is taller than display
-if SCREEN_SIZE > DISPLAY_HEIGHT:
-    print(
-        "Warning: game terrain taller than "
-        "screen height. The entire board will "
-        "not fit. Modify values in const.py "
-        "to resize."
-    )
+# Keep the window on screen, leaving some room for
+# window decorations. The camera shows the rest
+if DISPLAY_HEIGHT > 0:
+    SCREEN_SIZE = min(SCREEN_SIZE, DISPLAY_HEIGHT - 2 * TERRAIN_MARGIN)
@@ -0,0 +1,537 @@
+""" Endless boards for PySweeper.
+
+An endless board has no side: the world is split into
+square chunks of chunk_side plots, and the mines of a chunk
+are drawn from a hash of the seed and the chunk coordinates
+the first time it is needed, so every chunk always comes
+back the same. Chunks are kept in a dict used as an LRU
+cache. Pristine ones are dropped when it is full, since
+they can be drawn again at will, while the ones the player
+changed are spilled to disk and read back when touched.
+Memory use follows the explored area, not the world.
+
+Plots are addressed by (x, y) world coordinates, which can
+be negative. The game opens on a cleared area around the
+origin, and ends when a mine is hit.
+Like engine, this module does not need pygame.
+"""
+
+from collections import OrderedDict, deque
+from hashlib import blake2b
+from os import path, remove
+from random import Random, getrandbits
+from shutil import rmtree
+from tempfile import mkdtemp
+import struct
+
+import numpy as np
+
+from board import (
+    HIDDEN, FLAGGED, UNKNOWN,
+    UNMARKED_MINE, WRONG_FLAG, MARKED_MINE, EXPLODED_MINE
+)
+from engine import (
+    Result, REVEAL, FLAG, PLAYING, LOST, FLAG_TILES, SEED_RANGE,
+    sample_plots
+)
+
+
+CHUNK_SIDE = 32
+
+# Mines per plot. Openings stay finite at any density,
+# but grow huge as it drops towards the percolation
+# threshold: around 0.1, one click can clear hundreds of
+# thousands of plots. From MIN_DENSITY up, the largest
+# stay within a few thousand
+DENSITY = 0.16
+MIN_DENSITY = 0.13
+
+# Chunks kept in memory
+CAPACITY = 1024
+
+# Tiles of plots that are not revealed
+COVERED = (HIDDEN, FLAGGED, UNKNOWN)
+
+
+def chunk_seed(seed, cx, cy):
+    """ Return the seed of the chunk at cx, cy
+    in the world of seed.
+    """
+
+    key = blake2b(struct.pack('<Iqq', seed, cx, cy), digest_size=8)
+    return int.from_bytes(key.digest(), 'little')
+
+
+class Chunk():
+    """ chunk_side x chunk_side plots of the world, starting
+    at plot (cx * chunk_side, cy * chunk_side). Arrays are
+    indexed [y, x] like the Board's:
+     - mines: 1 if the plot holds a mine, 0 otherwise
+     - adjacent: quantity of mines around each plot,
+       counting those in the chunks around
+     - tiles: tile id each plot currently shows
+    modified tells whether the player changed anything
+    in it, pristine chunks can be generated again.
+    """
+
+    __slots__ = ('cx', 'cy', 'mines', 'adjacent', 'tiles', 'modified')
+
+    def __init__(self, cx, cy, mines, adjacent):
+        self.cx, self.cy = cx, cy
+        self.mines = mines
+        self.adjacent = adjacent
+        self.tiles = np.full(mines.shape, HIDDEN, dtype=np.uint8)
+        self.modified = False
+
+
+class Endless_Board():
+    """ Sparse, chunked terrain of the world of seed.
+     - density: mines per plot
+     - chunk_side: plots along one side of a chunk
+     - capacity: chunks kept in memory
+     - spill_path: folder modified chunks are spilled to,
+       a temporary one by default, removed by close()
+    changed holds the (x, y) of every plot whose tile
+    changed since it was last emptied.
+    """
+
+    def __init__(
+        self, seed, density=DENSITY, chunk_side=CHUNK_SIDE,
+        capacity=CAPACITY, spill_path=None
+    ):
+        self.seed = seed
+        self.density = density
+        self.chunk_side = chunk_side
+        self.capacity = capacity
+
+        # Every chunk holds the same quantity of mines
+        self.chunk_mines = round(density * chunk_side ** 2)
+
+        # Least recently used first
+        self.chunks = OrderedDict()
+
+        # Chunks on disk, by coordinates
+        self.spilled = set()
+        self.spill_path = spill_path
+        self.temporary = spill_path is None
+
+        self.changed = set()
+
+
+    def mines_of(self, cx, cy):
+        """ Return the mines of the chunk at cx, cy, drawing
+        them if the chunk is not in memory. Plots next to the
+        origin never hold one, so that the game opens there.
+        """
+
+        if (cx, cy) in self.chunks:
+            return self.chunks[cx, cy].mines
+
+        side = self.chunk_side
+
+        # Plots of this chunk within one plot of the origin
+        zone = [
+            (y - cy * side) * side + x - cx * side
+            for y in (-1, 0, 1) if 0 <= y - cy * side < side
+            for x in (-1, 0, 1) if 0 <= x - cx * side < side
+        ]
+
+        mines = np.zeros((side, side), dtype=np.uint8)
+        mines.ravel()[sample_plots(
+            Random(chunk_seed(self.seed, cx, cy)),
+            side ** 2, self.chunk_mines, zone
+        )] = 1
+
+        return mines
+
+
+    def __adjacent(self, cx, cy, mines):
+        """ Count the mines around every plot of the chunk
+        at cx, cy, including those over its edges.
+        """
+
+        side = self.chunk_side
+
+        # The chunk with a one plot border taken
+        # from the eight chunks around it
+        padded = np.block([
+            [
+                mines if not dx and not dy
+                else self.mines_of(cx + dx, cy + dy)
+                for dx in (-1, 0, 1)
+            ]
+            for dy in (-1, 0, 1)
+        ]).astype(np.int16)[side - 1:2 * side + 1, side - 1:2 * side + 1]
+
+        adjacent = np.zeros((side, side), dtype=np.int16)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                if dx != 1 or dy != 1:
+                    adjacent += padded[dy:dy + side, dx:dx + side]
+
+        return adjacent
+
+
+    def chunk(self, cx, cy):
+        """ Return the chunk at cx, cy, reading it back from
+        disk or generating it if it is not in memory.
+        """
+
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        mines = self.mines_of(cx, cy)
+        chunk = Chunk(cx, cy, mines, self.__adjacent(cx, cy, mines))
+
+        if key in self.spilled:
+            self.__unspill(chunk)
+
+        self.chunks[key] = chunk
+
+        while len(self.chunks) > self.capacity:
+            self.__evict()
+
+        return chunk
+
+
+    def __evict(self):
+        """ Drop the least recently used chunk,
+        spilling it first if it was modified.
+        """
+
+        key, chunk = self.chunks.popitem(last=False)
+
+        if chunk.modified:
+            self.__spill(chunk)
+
+
+    def __chunk_file(self, cx, cy):
+        return path.join(self.spill_path, '{}_{}.chunk'.format(cx, cy))
+
+
+    def __spill(self, chunk):
+        """ Write the tiles of chunk to disk. Everything
+        else can be worked out again from them and the seed.
+        """
+
+        if self.spill_path is None:
+            self.spill_path = mkdtemp(prefix='pysweeper-')
+
+        with open(self.__chunk_file(chunk.cx, chunk.cy), 'wb') as spill:
+            spill.write(chunk.tiles.tobytes())
+
+        self.spilled.add((chunk.cx, chunk.cy))
+
+
+    def __unspill(self, chunk):
+        """ Read the tiles of chunk back from disk. """
+
+        file_path = self.__chunk_file(chunk.cx, chunk.cy)
+
+        with open(file_path, 'rb') as spill:
+            tiles = np.frombuffer(spill.read(), dtype=np.uint8)
+
+        if tiles.size != chunk.tiles.size:
+            raise ValueError('Spilled chunk {} is damaged'.format(file_path))
+
+        chunk.tiles[:] = tiles.reshape(chunk.tiles.shape)
+        chunk.modified = True
+
+        # Memory holds the only up to date copy again
+        remove(file_path)
+        self.spilled.discard((chunk.cx, chunk.cy))
+
+
+    def locate(self, x, y):
+        """ Return the chunk holding plot x, y and the
+        plot's offsets within it.
+        """
+
+        cx, local_x = divmod(x, self.chunk_side)
+        cy, local_y = divmod(y, self.chunk_side)
+
+        return self.chunk(cx, cy), local_x, local_y
+
+
+    def tile(self, x, y):
+        chunk, local_x, local_y = self.locate(x, y)
+        return int(chunk.tiles[local_y, local_x])
+
+
+    def set_tile(self, x, y, tile):
+        chunk, local_x, local_y = self.locate(x, y)
+        chunk.tiles[local_y, local_x] = tile
+        chunk.modified = True
+        self.changed.add((x, y))
+
+
+    def window(self, x_start, x_stop, y_start, y_stop):
+        """ Return the tiles of plots x_start to x_stop - 1
+        across and y_start to y_stop - 1 down, as an array
+        indexed [y, x]. Chunks that were never touched show
+        HIDDEN without being generated.
+        """
+
+        side = self.chunk_side
+        tiles = np.full(
+            (y_stop - y_start, x_stop - x_start), HIDDEN, dtype=np.uint8
+        )
+
+        for cy in range(y_start // side, (y_stop - 1) // side + 1):
+            for cx in range(x_start // side, (x_stop - 1) // side + 1):
+                key = (cx, cy)
+                if key not in self.chunks and key not in self.spilled:
+                    continue
+
+                chunk = self.chunk(cx, cy)
+
+                # Overlap of the chunk and the window, in world plots
+                left = max(x_start, cx * side)
+                right = min(x_stop, (cx + 1) * side)
+                top = max(y_start, cy * side)
+                bottom = min(y_stop, (cy + 1) * side)
+
+                tiles[top - y_start:bottom - y_start,
+                      left - x_start:right - x_start] = chunk.tiles[
+                    top - cy * side:bottom - cy * side,
+                    left - cx * side:right - cx * side
+                ]
+
+        return tiles
+
+
+    def close(self):
+        """ Remove the spill folder, if it is a temporary one. """
+
+        if self.temporary and self.spill_path is not None:
+            rmtree(self.spill_path, ignore_errors=True)
+            self.spill_path = None
+
+        self.spilled.clear()
+
+
+class Endless_Engine():
+    """ One endless game. Like Engine, players act through
+    act(Action(kind, index)), but index is an (x, y) pair,
+    and Results list ((x, y), tile) pairs. There is no
+    winning, revealed_plots keeps the score.
+     - seed: seed of the first world, later games use
+       seed + 1, seed + 2... or a random one without it
+     - density, chunk_side, capacity and spill_path are
+       passed on to the Endless_Board
+    """
+
+    def __init__(
+        self, seed=None, density=DENSITY, chunk_side=CHUNK_SIDE,
+        capacity=CAPACITY, spill_path=None
+    ):
+        if not MIN_DENSITY <= density < 1:
+            raise ValueError(
+                'Mine density must be between {} and 1'.format(MIN_DENSITY)
+            )
+
+        self.density = density
+        self.chunk_side = chunk_side
+        self.capacity = capacity
+        self.spill_path = spill_path
+
+        self.seeded = seed is not None
+        self.seed = None
+        self.board = None
+
+        self.new_game(seed)
+
+
+    def new_game(self, seed=None):
+        """ Start a new world from seed, or from the next
+        seed if there is none, and open it at the origin.
+        """
+
+        if seed is None:
+            if self.seeded and self.seed is not None:
+                seed = (self.seed + 1) % SEED_RANGE
+            else:
+                seed = getrandbits(32)
+
+        self.seed = seed
+
+        if self.board is not None:
+            self.board.close()
+
+        self.board = Endless_Board(
+            seed, self.density, self.chunk_side,
+            self.capacity, self.spill_path
+        )
+
+        self.has_clicked = False
+        # 0 = playing, 1 = lost
+        self.play_state = PLAYING
+        self.marked_mines = 0
+        self.revealed_plots = 0
+
+        # The origin has no mines around it
+        self.__show(0, 0, 0, [])
+        self.reveal_adjacent((0, 0))
+
+
+    def close(self):
+        """ Clean up after the current world. """
+
+        self.board.close()
+
+
+    def act(self, action):
+        """ Apply action and return its Result. """
+
+        if action.kind == REVEAL:
+            return self.reveal(action.index)
+        if action.kind == FLAG:
+            return self.toggle_flag(action.index)
+
+        raise ValueError('Unknown action kind: {}'.format(action.kind))
+
+
+    def reveal(self, plot):
+        """ Reveal the plot at (x, y), as a left-click would. """
+
+        x, y = plot
+        chunk, local_x, local_y = self.board.locate(x, y)
+        tiles = []
+
+        if (
+            self.play_state
+            or chunk.tiles[local_y, local_x] != HIDDEN
+        ):
+            return Result(tiles, self.play_state)
+
+        self.has_clicked = True
+
+        if chunk.mines[local_y, local_x]:
+            self.__show(x, y, EXPLODED_MINE, tiles)
+            self.play_state = LOST
+            tiles.extend(self.reveal_all())
+            return Result(tiles, self.play_state)
+
+        adjacent = int(chunk.adjacent[local_y, local_x])
+        self.__show(x, y, adjacent, tiles)
+
+        if adjacent == 0:
+            tiles.extend(self.reveal_adjacent(plot))
+
+        return Result(tiles, self.play_state)
+
+
+    def toggle_flag(self, plot):
+        """ Cycle the plot at (x, y) between unmarked,
+        flagged and unknown, as a right-click would.
+        """
+
+        x, y = plot
+        tile = self.board.tile(x, y)
+
+        if self.play_state or tile not in COVERED:
+            return Result([], self.play_state)
+
+        self.has_clicked = True
+
+        state = (FLAG_TILES.index(tile) + 1) % 3
+        self.board.set_tile(x, y, FLAG_TILES[state])
+
+        if state == 1:
+            self.marked_mines += 1
+        elif state == 2:
+            self.marked_mines -= 1
+
+        return Result([(plot, FLAG_TILES[state])], self.play_state)
+
+
+    def __show(self, x, y, tile, tiles):
+        """ Reveal the plot at x, y showing tile, and
+        record it in tiles.
+        """
+
+        self.board.set_tile(x, y, tile)
+        self.revealed_plots += 1
+        tiles.append(((x, y), tile))
+
+
+    def reveal_adjacent(self, plot):
+        """ Reveal all plots around the one at (x, y), and
+        those around them, until all plots are next to
+        mines, across chunks. Return the ((x, y), tile)
+        pairs revealed.
+        """
+
+        board = self.board
+        side = self.chunk_side
+
+        visited = {plot}
+        plot_queue = deque([plot])
+        tiles = []
+
+        while plot_queue:
+            x, y = plot_queue.popleft()
+
+            for adj_y in (y - 1, y, y + 1):
+                for adj_x in (x - 1, x, x + 1):
+                    if (adj_x, adj_y) in visited:
+                        continue
+                    visited.add((adj_x, adj_y))
+
+                    cx, local_x = divmod(adj_x, side)
+                    cy, local_y = divmod(adj_y, side)
+                    chunk = board.chunk(cx, cy)
+
+                    # Revealed plots are done, and
+                    # marked ones keep their mark
+                    if chunk.tiles[local_y, local_x] != HIDDEN:
+                        continue
+
+                    adjacent = int(chunk.adjacent[local_y, local_x])
+                    self.__show(adj_x, adj_y, adjacent, tiles)
+
+                    if adjacent == 0:
+                        plot_queue.append((adj_x, adj_y))
+
+        return tiles
+
+
+    def reveal_all(self):
+        """ Unveil the mines and wrong flags of every chunk in
+        memory, which holds the explored area and the plots
+        around it. Return the ((x, y), tile) pairs shown.
+        """
+
+        board = self.board
+        side = self.chunk_side
+        tiles = []
+
+        for chunk in board.chunks.values():
+            mined = chunk.mines == 1
+            flagged = chunk.tiles == FLAGGED
+
+            shown = np.full(chunk.tiles.shape, 255, dtype=np.uint8)
+            shown[mined & (chunk.tiles == HIDDEN)] = UNMARKED_MINE
+            shown[mined & (chunk.tiles == UNKNOWN)] = UNMARKED_MINE
+            shown[mined & flagged] = MARKED_MINE
+            shown[~mined & flagged] = WRONG_FLAG
+
+            ys, xs = np.nonzero(shown != 255)
+            if not xs.size:
+                continue
+
+            chunk.tiles[ys, xs] = shown[ys, xs]
+            chunk.modified = True
+
+            for local_x, local_y, tile in zip(
+                xs.tolist(), ys.tolist(), shown[ys, xs].tolist()
+            ):
+                plot = (chunk.cx * side + local_x, chunk.cy * side + local_y)
+                board.changed.add(plot)
+                tiles.append((plot, tile))
+
+        return tiles
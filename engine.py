@@ -0,0 +1,487 @@
+""" Headless game engine for PySweeper.
+
+All the game rules (generation, reveal, flagging, victory
+and the first-click clear_area) live here, on top of a
+Board. Nothing in here imports pygame or const, so games
+can be run without a display, in batch jobs or in tests.
+
+Players act through act(Action(kind, index)), where index
+is a flat plot index (y * terrain_side + x), and get back
+a Result listing every (index, tile) pair whose tile on
+screen changed, along with the new play_state. The plots
+unveiled when a game ends are left out of it, like every
+other change they are in board.changed.
+"""
+
+from collections import deque, namedtuple
+from random import Random, getrandbits
+
+import numpy as np
+
+from board import (
+    Board, HIDDEN, FLAGGED, UNKNOWN, EXPLODED_MINE
+)
+
+
+# Action kinds
+REVEAL = 0
+FLAG = 1
+
+# play_state values
+PLAYING = 0
+LOST = 1
+WON = 2
+
+# Tile shown for each flag state
+FLAG_TILES = (HIDDEN, FLAGGED, UNKNOWN)
+
+Action = namedtuple('Action', ['kind', 'index'])
+Result = namedtuple('Result', ['tiles', 'play_state'])
+
+# Seeds are unsigned 32 bit integers
+SEED_RANGE = 2 ** 32
+
+
+def sample_plots(rng, plot_quantity, quantity, excluded=()):
+    """ Return quantity distinct flat indices drawn from
+    range(plot_quantity), none of them in excluded, using
+    rng. Takes O(quantity) time (Floyd's algorithm), however
+    large the board.
+    """
+
+    excluded = sorted(excluded)
+    population = plot_quantity - len(excluded)
+
+    if not 0 <= quantity <= population:
+        raise ValueError(
+            'Cannot pick {} plots out of {}'.format(quantity, population)
+        )
+
+    chosen = set()
+
+    for j in range(population - quantity, population):
+        pick = rng.randrange(j + 1)
+        chosen.add(j if pick in chosen else pick)
+
+    # Turn ranks among the allowed plots back into plot
+    # indices, by skipping over every excluded plot
+    indices = []
+
+    for rank in chosen:
+        for plot in excluded:
+            if rank < plot:
+                break
+            rank += 1
+        indices.append(rank)
+
+    return indices
+
+
+class Engine():
+    """ One game of PySweeper on a square board of
+    terrain_side plots per side. topology is passed
+    on to the Board.
+     - seed: seed of the first board. The same seed always
+       gives the same board. Later games use seed + 1,
+       seed + 2... Without one, every game gets a random
+       seed, which is kept in self.seed.
+     - mine_quantity: mines per board, by default between
+       a seventh and a fifth of the plots
+     - defer_mines: if True, mines are only placed on the
+       first click, around the clicked plot, instead of
+       being moved away from it afterwards
+     - mine_layout: with defer_mines, a function called as
+       mine_layout(engine, index) on a first click on index.
+       It returns the flat indices of the mines to place,
+       or None for a random layout.
+     - win_by_reveal: also win once every safe plot is
+       revealed, not only once exactly the mines are flagged
+    Victory is tracked with counters kept up to date by every
+    action: correct_flags and wrong_flags (plots flagged with
+    and without a mine) and hidden_safe (safe plots not yet
+    revealed). Code that changes the board other than through
+    act() has to call recount().
+    """
+
+    def __init__(
+        self, terrain_side, topology=None,
+        seed=None, mine_quantity=None, defer_mines=False,
+        mine_layout=None, win_by_reveal=False
+    ):
+        # Terrain side is the number of plots
+        # along one side of the game terrain
+        self.terrain_side = terrain_side
+        self.plot_quantity = terrain_side ** 2
+
+        if mine_quantity is not None and not (
+            0 <= mine_quantity < self.plot_quantity
+        ):
+            raise ValueError(
+                'A board of {} plots holds at most {} mines'.format(
+                    self.plot_quantity, self.plot_quantity - 1
+                )
+            )
+
+        self.requested_mines = mine_quantity
+        self.defer_mines = defer_mines
+        self.mine_layout = mine_layout
+        self.win_by_reveal = win_by_reveal
+
+        self.seeded = seed is not None
+        self.seed = None
+
+        self.board = Board(terrain_side, topology)
+
+        self.new_game(seed)
+
+
+    def new_game(self, seed=None):
+        """ Reset the game state and generate a new board
+        from seed, or from the next seed if there is none.
+        seed must be between 0 and SEED_RANGE - 1.
+        """
+
+        if seed is None:
+            if self.seeded and self.seed is not None:
+                seed = (self.seed + 1) % SEED_RANGE
+            else:
+                seed = getrandbits(32)
+        elif not 0 <= seed < SEED_RANGE:
+            raise ValueError(
+                'Seeds are from 0 to {}'.format(SEED_RANGE - 1)
+            )
+
+        self.seed = seed
+        self.rng = Random(seed)
+
+        self.has_clicked = False
+        # 0 = playing, 1 = lost, 2 = won
+        self.play_state = PLAYING
+        self.marked_mines = 0
+
+        self.__generate_mine_map()
+
+
+    def __generate_mine_map(self):
+        """ Generate the map of the terrain
+        and fill it randomly with mines, unless
+        placing them waits for the first click.
+        """
+
+        if self.requested_mines is not None:
+            self.mine_quantity = self.requested_mines
+        else:
+            self.mine_quantity = (
+                10 if self.terrain_side == 9 or self.terrain_side == 10
+                else self.rng.randrange(
+                    # Int conversion rounds down
+                    int(self.plot_quantity / 7),
+                    int(self.plot_quantity / 5)
+                )
+            )
+
+        if self.defer_mines:
+            self.board.place_mines(())
+            self.mines_placed = False
+        else:
+            self.board.place_mines(sample_plots(
+                self.rng, self.plot_quantity, self.mine_quantity
+            ))
+            self.mines_placed = True
+
+        self.recount()
+
+
+    def recount(self):
+        """ Count the flags and the hidden safe plots that
+        check_victory() relies on, from the whole board.
+        """
+
+        board = self.board
+        mined = board.mines == 1
+        flagged = board.flags == 1
+
+        self.correct_flags = int(np.count_nonzero(mined & flagged))
+        self.wrong_flags = int(np.count_nonzero(~mined & flagged))
+        self.hidden_safe = int(np.count_nonzero(~mined & ~board.revealed))
+
+
+    def __safe_zone(self, index):
+        """ Return the plot at index followed by its
+        neighbours, as a list of flat indices.
+        """
+
+        return [index] + self.board.topology.neighbours_of(index).tolist()
+
+
+    def place_mines(self, index):
+        """ Place all mines, anywhere but on the plot at index
+        and its neighbours. Used on the first click when
+        placing mines was deferred.
+        """
+
+        mines = None
+
+        if self.mine_layout is not None:
+            mines = self.mine_layout(self, index)
+
+        if mines is None:
+            zone = self.__safe_zone(index)
+
+            if self.mine_quantity > self.plot_quantity - len(zone):
+                # Too crowded to spare the neighbours,
+                # only spare the clicked plot
+                zone = [index]
+
+            mines = sample_plots(
+                self.rng, self.plot_quantity, self.mine_quantity, zone
+            )
+
+        board = self.board
+
+        # Marks made before the first click stay
+        flags = board.flags.copy()
+        tiles = board.tiles.copy()
+
+        board.place_mines(mines)
+        board.flags[:] = flags
+        board.tiles[:] = tiles
+        self.mines_placed = True
+        self.recount()
+
+
+    def act(self, action):
+        """ Apply action and return its Result. """
+
+        if action.kind == REVEAL:
+            return self.reveal(action.index)
+        if action.kind == FLAG:
+            return self.toggle_flag(action.index)
+
+        raise ValueError('Unknown action kind: {}'.format(action.kind))
+
+
+    def reveal(self, index):
+        """ Reveal the plot at index, as a left-click would. """
+
+        board = self.board
+        tiles = []
+
+        if (
+            self.play_state
+            or board.revealed.flat[index]
+            or board.flags.flat[index]
+        ):
+            return Result(tiles, self.play_state)
+
+        if not self.has_clicked:
+            # Player can't die on first click.
+            # Clear plot and zone around it
+            # to make sure it's not
+            # impossible
+            if self.mines_placed:
+                self.clear_area(index)
+            else:
+                self.place_mines(index)
+            self.has_clicked = True
+
+        # Clicked on mined plot
+        if board.mines.flat[index]:
+            self.__show(index, EXPLODED_MINE, tiles)
+            self.play_state = LOST
+            self.reveal_all()
+            return Result(tiles, self.play_state)
+
+        adjacent = int(board.adjacent.flat[index])
+        self.__show(index, adjacent, tiles)
+
+        if adjacent == 0:
+            # No adjacent mines, check further
+            tiles.extend(self.reveal_adjacent(index))
+
+        if self.check_victory():
+            self.reveal_all()
+
+        return Result(tiles, self.play_state)
+
+
+    def toggle_flag(self, index):
+        """ Cycle the plot at index between unmarked,
+        flagged and unknown, as a right-click would.
+        """
+
+        board = self.board
+
+        if self.play_state or board.revealed.flat[index]:
+            return Result([], self.play_state)
+
+        state = (int(board.flags.flat[index]) + 1) % 3
+        board.flags.flat[index] = state
+        board.tiles.flat[index] = FLAG_TILES[state]
+        board.changed.add(index)
+
+        # Only going in and out of flagged (1)
+        # changes the counts
+        if state:
+            change = 1 if state == 1 else -1
+            self.marked_mines += change
+            if board.mines.flat[index]:
+                self.correct_flags += change
+            else:
+                self.wrong_flags += change
+
+        tiles = [(index, FLAG_TILES[state])]
+
+        if self.check_victory():
+            self.reveal_all()
+
+        return Result(tiles, self.play_state)
+
+
+    def __show(self, index, tile, tiles):
+        """ Mark the plot at index as revealed and
+        record that it now shows tile.
+        """
+
+        self.board.revealed.flat[index] = True
+        self.board.tiles.flat[index] = tile
+        self.board.changed.add(index)
+        tiles.append((index, tile))
+
+        if not self.board.mines.flat[index]:
+            self.hidden_safe -= 1
+
+
+    def clear_area(self, index):
+        """ Move mines away from the plot at index and its
+        neighbours. Only used once per game, on the
+        player's first click.
+        """
+
+        board = self.board
+        side = self.terrain_side
+        mines = board.mines.ravel()
+
+        # Clicked plot first, so that it is the one
+        # cleared if there is not room for all of them
+        zone = self.__safe_zone(index)
+        mined = [plot for plot in zone if mines[plot]]
+
+        if not mined:
+            return
+
+        excluded = set(zone)
+        targets = []
+
+        # Random picks are quick while the board has
+        # room, but give up after a bounded number of tries
+        for attempt in range(32 * len(mined)):
+            if len(targets) == len(mined):
+                break
+            target = self.rng.randrange(self.plot_quantity)
+            if target not in excluded and not mines[target]:
+                excluded.add(target)
+                targets.append(target)
+        else:
+            # Crowded board: pick among the free plots left
+            free = [
+                plot for plot in np.flatnonzero(mines == 0).tolist()
+                if plot not in excluded
+            ]
+            targets.extend(self.rng.sample(
+                free, min(len(free), len(mined) - len(targets))
+            ))
+
+        if not targets and mines[index]:
+            # No room outside the zone at all: move the
+            # clicked plot's mine onto a neighbour instead
+            inside = [plot for plot in zone[1:] if not mines[plot]]
+            targets.append(self.rng.choice(inside))
+
+        for plot, target in zip(mined, targets):
+            board.set_mine(target % side, target // side, 1)
+            board.set_mine(plot % side, plot // side, 0)
+
+        # Flags may have been on the plots that changed
+        self.recount()
+
+
+    def reveal_adjacent(self, index):
+        """ Reveal all plots adjacent to the one at index, and
+        those adjacent to them, until all plots are adjacent
+        to mines. Return the (index, tile) pairs revealed.
+        """
+
+        neighbours_of = self.board.topology.neighbours_of
+        revealed_map = self.board.revealed.ravel()
+        adjacent_map = self.board.adjacent.ravel()
+
+        # Flat index of every plot that has been looked
+        # at, so that each one is only visited once
+        visited = {index}
+
+        index_queue = deque([index])
+        tiles = []
+
+        # Empty iterables are False (PEP8)
+        while index_queue:
+
+            for adj_index in neighbours_of(index_queue.popleft()).tolist():
+
+                if adj_index in visited:
+                    continue
+                visited.add(adj_index)
+
+                if revealed_map[adj_index]:
+                    continue
+
+                adjacent = int(adjacent_map[adj_index])
+                self.__show(adj_index, adjacent, tiles)
+
+                if adjacent == 0:
+                    # No adjacent mines, check further
+                    index_queue.append(adj_index)
+
+        return tiles
+
+
+    def check_victory(self):
+        """ Check if the player has won, by verifying that
+        exclusively all plots with mines have been marked
+        or, with win_by_reveal, that every safe plot has been
+        revealed. Return True if they have. Only reads the
+        counters, so it takes the same time on any board.
+        """
+
+        if (
+            self.correct_flags == self.mine_quantity
+            and not self.wrong_flags
+        ) or (
+            self.win_by_reveal and self.mines_placed
+            and not self.hidden_safe
+        ):
+            self.play_state = WON
+            return True
+
+        return False
+
+
+    def reveal_all(self):
+        """ Unveil all the plots. Return the flat indices
+        of the plots that were still hidden, as an array.
+        """
+
+        board = self.board
+
+        # Mines that were not marked, marked mines,
+        # safe plots that were marked, and numbers
+        # for everything else
+        tiles = board.reveal_tiles().ravel()
+        hidden = np.flatnonzero(~board.revealed.ravel())
+
+        board.revealed.ravel()[hidden] = True
+        board.tiles.ravel()[hidden] = tiles[hidden]
+        self.hidden_safe = 0
+        board.changed.update(hidden.tolist())
+
+        return hidden
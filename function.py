@@ -1,4 +1,13 @@
-""" Functions for PySweeper, currently only one. """
+""" Functions for PySweeper: getting the game options
+from the player, the command line or a config file.
+"""
+
+from argparse import ArgumentParser, ArgumentTypeError
+from configparser import ConfigParser
+from os import path
+
+CONFIG_FILE = path.join(path.dirname(__file__), 'pysweeper.ini')
+
 
 def request_size(min_size, max_size):
     """ Get the user disired length of the terrain side
@@ -28,4 +37,139 @@ def request_size(min_size, max_size):
         except ValueError:
             print("Error: input should be a number!")
     return size
-    
\ No newline at end of file
+    
+
+def seed(text):
+    """ Parse a board seed, between 0 and 2 ** 32 - 1. """
+
+    try:
+        value = int(text)
+    except ValueError:
+        raise ArgumentTypeError("expected a number, got " + text)
+
+    if not 0 <= value < 2 ** 32:
+        raise ArgumentTypeError("seed must be from 0 to 4294967295")
+
+    return value
+
+
+def frame_window(text):
+    """ Parse 'FIRST:LAST' into a (first, last) frame range. """
+
+    try:
+        first, last = (int(frame) for frame in text.split(':'))
+    except ValueError:
+        raise ArgumentTypeError("expected FIRST:LAST, got " + text)
+
+    if not 0 <= first < last:
+        raise ArgumentTypeError("FIRST must come before LAST")
+
+    return first, last
+
+
+def load_config(argv=None):
+    """ Read game options from the command line (argv,
+    sys.argv by default) and from a config file, and return
+    a dict holding only the options that were given.
+    Command line options win over the config file.
+    """
+
+    parser = ArgumentParser(
+        description="PySweeper - A small Minesweeper remake"
+    )
+    parser.add_argument(
+        '-s', '--size', type=int,
+        help="number of plots along one side of the terrain "
+        "(default: 9)"
+    )
+    parser.add_argument(
+        '--ask-size', action='store_true', default=None,
+        help="ask for the terrain size at startup when none is given"
+    )
+    parser.add_argument(
+        '--plot-size', type=int, help="size of a plot, in pixels"
+    )
+    parser.add_argument(
+        '--padding', type=int, help="space between plots, in pixels"
+    )
+    parser.add_argument(
+        '-m', '--mines', type=int,
+        help="number of mines, by default a seventh to a fifth "
+        "of the plots"
+    )
+    parser.add_argument(
+        '--seed', type=seed,
+        help="seed of the first board, the same seed always "
+        "gives the same board"
+    )
+    parser.add_argument(
+        '--no-guess', action='store_true', default=None,
+        help="only deal boards that can be cleared without guessing"
+    )
+    parser.add_argument(
+        '--win-by-reveal', action='store_true', default=None,
+        help="also win by revealing every safe plot, without "
+        "flagging the mines"
+    )
+    parser.add_argument(
+        '--endless', action='store_true', default=None,
+        help="play on an endless board, generated as you explore it"
+    )
+    parser.add_argument(
+        '-l', '--load', metavar='SAVE',
+        help="resume the game saved in SAVE, its board size "
+        "replaces --size"
+    )
+    parser.add_argument(
+        '--replay', metavar='FILE',
+        help="watch the game recorded in FILE, in real time"
+    )
+    parser.add_argument(
+        '--profile-trace', metavar='FILE',
+        help="time every frame and write the timings to FILE "
+        "on exit, as CSV if it ends in .csv, JSON otherwise"
+    )
+    parser.add_argument(
+        '--cprofile', metavar='FILE',
+        help="run cProfile over --cprofile-frames and write "
+        "its stats to FILE"
+    )
+    parser.add_argument(
+        '--cprofile-frames', metavar='FIRST:LAST', type=frame_window,
+        default=(0, 600),
+        help="frames to run cProfile over (default: 0:600)"
+    )
+    parser.add_argument(
+        '-c', '--config', default=CONFIG_FILE,
+        help="INI file with a [pysweeper] section holding any of "
+        "size, plot_size, padding, mines, no_guess, win_by_reveal, "
+        "endless and ask_size "
+        "(default: %(default)s)"
+    )
+
+    # Leave arguments we don't know about to whoever imported us
+    args = parser.parse_known_args(argv)[0]
+
+    config = {}
+
+    file_config = ConfigParser()
+    if file_config.read(args.config) and file_config.has_section('pysweeper'):
+        section = file_config['pysweeper']
+        for key in ('size', 'plot_size', 'padding', 'mines'):
+            if key in section:
+                config[key] = section.getint(key)
+        for key in ('no_guess', 'win_by_reveal', 'endless', 'ask_size'):
+            if key in section:
+                config[key] = section.getboolean(key)
+
+    for key in (
+        'size', 'plot_size', 'padding', 'mines', 'seed', 'no_guess',
+        'win_by_reveal', 'endless', 'ask_size', 'load', 'replay',
+        'profile_trace', 'cprofile'
+    ):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    config['cprofile_frames'] = args.cprofile_frames
+
+    return config
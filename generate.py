@@ -0,0 +1,211 @@
+""" No-guess board generation for PySweeper.
+
+No_Guess_Layout is a mine_layout for an Engine with
+deferred mines: once the first plot is clicked, it draws
+candidate layouts and keeps the first one the Solver can
+clear from that click without ever guessing. Candidates
+are checked in batches over a pool of worker processes,
+and if none passes before the timeout the Engine places a
+normal board instead.
+Candidate k of a game is drawn from the game's seed and k,
+and the lowest passing k is kept, so a seeded game gets the
+same board however many workers there are.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import get_context, get_all_start_methods
+from os import cpu_count
+from random import Random
+from time import monotonic
+
+from engine import Engine, Action, REVEAL, PLAYING, WON, sample_plots
+from solver import Solver
+from topology import Topology
+
+
+def candidate(engine, seed, k, zone):
+    """ Return candidate layout k for the game of engine
+    seeded with seed, avoiding the plots in zone.
+    """
+
+    return sample_plots(
+        Random('{}-{}'.format(seed, k)),
+        engine.plot_quantity, engine.mine_quantity, zone
+    )
+
+
+def is_no_guess(engine, mines, index):
+    """ True if the Solver clears the board holding mines
+    from a first click on index, without guessing.
+    Plays the game out on engine.
+    """
+
+    engine.new_game(engine.seed)
+    engine.board.place_mines(mines)
+    engine.mines_placed = True
+    engine.recount()
+
+    solver = Solver(engine)
+    solver.update(engine.act(Action(REVEAL, index)))
+
+    while engine.play_state == PLAYING:
+        action = solver.hint()
+        if action is None:
+            return False
+        solver.update(engine.act(action))
+
+    return engine.play_state == WON
+
+
+def search(board, first, last, deadline):
+    """ Check candidates first to last - 1 of the board
+    described by board, a (terrain_side, radius, wrap,
+    mine_quantity, seed, index, zone) tuple, until one
+    passes or monotonic() reaches deadline. Return the
+    passing k and its mines, or None. This is what every
+    worker process runs.
+    """
+
+    side, radius, wrap, mine_quantity, seed, index, zone = board
+
+    engine = Engine(
+        side, Topology(side, radius, wrap), seed=seed,
+        mine_quantity=mine_quantity, defer_mines=True
+    )
+
+    for k in range(first, last):
+        if monotonic() > deadline:
+            return None
+
+        mines = candidate(engine, seed, k, zone)
+        if is_no_guess(engine, mines, index):
+            return k, mines
+
+    return None
+
+
+class No_Guess_Layout():
+    """ mine_layout that only gives boards the Solver can
+    clear from the first click.
+     - timeout: seconds to search before giving up
+     - workers: worker processes, one per core by default.
+       With 1, candidates are checked in this process.
+     - batch: candidates per task
+    fell_back tells whether the last board had to be a
+    normal one.
+    """
+
+    def __init__(self, timeout=2.0, workers=None, batch=8):
+        self.timeout = timeout
+        self.workers = workers or cpu_count() or 1
+        self.batch = batch
+
+        # main.py sets the game up on import, which spawned
+        # workers would do again: only fork them, and check
+        # candidates here where fork is not available
+        if 'fork' not in get_all_start_methods():
+            self.workers = 1
+
+        self.pool = None
+        self.fell_back = False
+
+
+    def __call__(self, engine, index):
+        """ Return the mines of a no-guess board for a first
+        click on index, or None if none was found in time.
+        """
+
+        topology = engine.board.topology
+        zone = [index] + topology.neighbours_of(index).tolist()
+
+        if engine.mine_quantity > engine.plot_quantity - len(zone):
+            # No opening, the first click can't go anywhere
+            self.fell_back = True
+            return None
+
+        board = (
+            engine.terrain_side, topology.radius, topology.wrap,
+            engine.mine_quantity, engine.seed, index, zone
+        )
+        deadline = monotonic() + self.timeout
+
+        if self.workers == 1:
+            found = self.__search_here(board, deadline)
+        else:
+            found = self.__search_pool(board, deadline)
+
+        self.fell_back = found is None
+
+        return found
+
+
+    def __search_here(self, board, deadline):
+        first = 0
+
+        while monotonic() < deadline:
+            found = search(board, first, first + self.batch, deadline)
+            if found is not None:
+                return found[1]
+            first += self.batch
+
+        return None
+
+
+    def __search_pool(self, board, deadline):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=get_context('fork')
+            )
+
+        # Batch starts by future, two batches queued per worker
+        running = {}
+        first = 0
+        best = None
+
+        def submit():
+            nonlocal first
+            running[self.pool.submit(
+                search, board, first, first + self.batch, deadline
+            )] = first
+            first += self.batch
+
+        for task in range(2 * self.workers):
+            submit()
+
+        while running:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+
+            done = wait(
+                running, timeout=remaining, return_when=FIRST_COMPLETED
+            )[0]
+
+            for future in done:
+                del running[future]
+                found = future.result()
+                if found is not None and (best is None or found[0] < best[0]):
+                    best = found
+                elif best is None:
+                    submit()
+
+            # Batches before the best one may still find a
+            # lower k, the ones after it can't matter
+            if best is not None:
+                for future, start in list(running.items()):
+                    if start > best[0]:
+                        future.cancel()
+                        running.pop(future)
+
+        for future in running:
+            future.cancel()
+
+        return None if best is None else best[1]
+
+
+    def close(self):
+        """ Stop the worker processes. """
+
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
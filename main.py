@@ -6,84 +6,482 @@ Feel free to do what you like with it.
 USAGE:
  - customize const.py to your liking (although default
    configuration is typically fine).
- - install pygame if you haven't already (`pip install pygame`)
- - run main.py
+ - install pygame and numpy if you haven't already
+   (`pip install pygame numpy`)
+ - run main.py, optionally with the board size and
+   more on the command line (`python main.py --help`)
 """
 
 # pylint: disable=unused-wildcard-import, no-member, no-name-in-module
 
+from os import path, makedirs, remove
+from time import perf_counter
+
+# Measure startup from before pygame is imported
+STARTED = perf_counter()
+
 import pygame
-from pygame.constants import MOUSEBUTTONUP, MOUSEBUTTONDOWN, QUIT
+from pygame.constants import (
+    MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION, MOUSEWHEEL,
+    KEYDOWN, QUIT, USEREVENT,
+    K_F3, K_F4, K_F5, K_F9, K_h, K_a, K_p,
+    K_LEFT, K_RIGHT, K_UP, K_DOWN
+)
+
+import snapshot
+import replay
+from generate import No_Guess_Layout
+from profiler import Frame_Profiler
+from obj import (
+    Terrain_Manager, Endless_Manager, Stat_Manager, Profile_Overlay
+)
+from const import (
+    ICON_PATH, PLOT_TILES, TERRAIN_SIDE, SCREEN_SIZE,
+    BACKGROUND, DIRTY_RENDERING,
+    IDLE_WAIT, FRAMERATE, CLOCK_REFRESH,
+    CONFIG, DATA_PATH, SAVE_FILE, RECOVERY_FILE,
+    SEED, MINE_QUANTITY, DEFER_MINES, AUTO_SOLVE_MOVES,
+    NO_GUESS, NO_GUESS_TIMEOUT, PROFILE_FILE,
+    WIN_BY_REVEAL, ENDLESS, ENDLESS_DENSITY,
+    RECORD_REPLAYS, REPLAY_PATH
+)
+
+# Timer event that refreshes the clock while idle
+CLOCK_EVENT = USEREVENT
 
-from obj import Terrain_Manager, Stat_Manager
-from const import ICON, TERRAIN_SIDE, SCREEN_SIZE
+# Arrow keys scroll the view, as (across, down)
+SCROLL_KEYS = {
+    K_LEFT: (-1, 0), K_RIGHT: (1, 0), K_UP: (0, -1), K_DOWN: (0, 1)
+}
 
-terrain = Terrain_Manager(TERRAIN_SIDE)
+# No-guess boards are dealt on the first click
+layout = No_Guess_Layout(NO_GUESS_TIMEOUT) if NO_GUESS else None
+
+if ENDLESS:
+    terrain = Endless_Manager(SEED, ENDLESS_DENSITY)
+else:
+    terrain = Terrain_Manager(
+        TERRAIN_SIDE, seed=SEED, mine_quantity=MINE_QUANTITY,
+        defer_mines=DEFER_MINES or NO_GUESS, mine_layout=layout,
+        win_by_reveal=WIN_BY_REVEAL,
+        replay_path=REPLAY_PATH if RECORD_REPLAYS else None
+    )
 manager = Stat_Manager(SCREEN_SIZE, terrain)
 
-print(
-    "Terrain size: {0}x{0}; "
-    "Number of plots: {1}; "
-    "Number of mines: {2};".format(
-        *terrain.get_stats()
+# Replay being watched, see start_replay()
+playback = None
+
+# Frame timings, only taken while the overlay is shown,
+# a trace is recorded or cProfile is running
+profiler = Frame_Profiler()
+overlay = None
+
+if 'profile_trace' in CONFIG:
+    profiler.timing = True
+    profiler.trace = []
+
+if 'cprofile' in CONFIG:
+    profiler.capture(*CONFIG['cprofile_frames'], CONFIG['cprofile'])
+
+if ENDLESS:
+    print(
+        "Endless terrain; "
+        "Mine density: {1}; "
+        "Seed: {0};".format(
+            *terrain.get_stats()
+        )
     )
-)
+else:
+    print(
+        "Terrain size: {0}x{0}; "
+        "Number of plots: {1}; "
+        "Number of mines: {2}; "
+        "Seed: {4};".format(
+            *terrain.get_stats()
+        )
+    )
+
+
+def render_all(display):
+    """ Redraw the whole window. """
+
+    # Render queue
+    # Highest last
+    display.fill(BACKGROUND)
+    terrain.render_plots(display)
+    if terrain.show_heatmap:
+        terrain.render_heatmap(display)
+    if profiler.recording:
+        profiler.lap('render_plots')
+        profiler.count('blits', terrain.plots_in_view)
+
+    manager.render_statbar(display)
+    manager.render_options(display)
+    if profiler.recording:
+        profiler.lap('render_statbar')
+
+    pygame.display.update()
+    if profiler.recording:
+        profiler.lap('display_update')
+
+
+def render_changes(display):
+    """ Redraw only what changed since the last frame,
+    and push only those rects to the screen.
+    """
+
+    if (
+        manager.options_changed() or terrain.backbuffer is None
+        # Any move changes the odds all over the board
+        or (terrain.show_heatmap and terrain.board.changed)
+    ):
+        # Options appeared or vanished, or the board was
+        # regenerated: composite everything once
+        terrain.render_backbuffer(display)
+        if terrain.show_heatmap:
+            terrain.render_heatmap(display)
+        if profiler.recording:
+            profiler.lap('render_plots')
+            profiler.count('blits', terrain.plots_in_view)
+
+        manager.render_statbar(display)
+        manager.render_options(display)
+        if profiler.recording:
+            profiler.lap('render_statbar')
+
+        pygame.display.update()
+        if profiler.recording:
+            profiler.lap('display_update')
+        return
+
+    rects = terrain.render_changes(display)
+    if profiler.recording:
+        profiler.lap('render_plots')
+        profiler.count('blits', len(rects))
+
+    rects.extend(manager.render_statbar_changes(display))
+    if profiler.recording:
+        profiler.lap('render_statbar')
+
+    if rects:
+        pygame.display.update(rects)
+    if profiler.recording:
+        profiler.lap('display_update')
+
+
+def toggle_overlay():
+    """ Show or hide the frame timing overlay. """
+
+    global overlay
+
+    if overlay is None:
+        overlay = Profile_Overlay(SCREEN_SIZE)
+        profiler.timing = True
+    else:
+        overlay = None
+        # Keep timing if a trace is being recorded
+        profiler.timing = profiler.trace is not None
+        # Clear the overlay off the screen
+        terrain.backbuffer = None
+
+
+def save_game(file_path):
+    """ Save the current game to file_path. """
+
+    makedirs(DATA_PATH, exist_ok=True)
+    snapshot.save(file_path, terrain.engine, manager.get_timer())
+
+
+def load_game(file_path):
+    """ Replace the current game with the one saved
+    in file_path, if it can be read.
+    """
+
+    try:
+        manager.set_timer(terrain.load(file_path))
+    except (OSError, ValueError) as error:
+        print("Could not load {}: {}".format(file_path, error))
+        return
+
+    manager.board_shown = False
+    manager.mouse_freed = False
+
+    print("Loaded", file_path)
+    keep_recovery()
+
+
+def keep_recovery():
+    """ Keep RECOVERY_FILE in step with the game, only
+    while there is a game in progress.
+    """
+
+    if ENDLESS or playback is not None:
+        # Endless and replayed games aren't saved,
+        # leave the recovered game of a normal one be
+        return
+
+    try:
+        if terrain.has_clicked and not terrain.play_state:
+            save_game(RECOVERY_FILE)
+        elif path.exists(RECOVERY_FILE):
+            remove(RECOVERY_FILE)
+    except OSError as error:
+        print("Could not keep the recovery file: {}".format(error))
+
+
+def start_replay(file_path):
+    """ Watch the game recorded in file_path, if it can
+    be read, its moves played at their recorded pace.
+    """
+
+    global playback
+
+    if ENDLESS:
+        print("Endless games can't be replayed")
+        return
+
+    try:
+        recorded = replay.load(file_path)
+        replay.prepare(terrain.engine, recorded)
+    except (OSError, ValueError) as error:
+        print("Could not load {}: {}".format(file_path, error))
+        return
+
+    terrain.solver.reset()
+    terrain.backbuffer = None
+    # Not a game of the player's
+    terrain.recorder = None
+
+    playback = replay.Playback(recorded)
+    print("Replaying", file_path)
+
+
+def replay_moves():
+    """ Play the moves of the replay that are due. """
+
+    global playback
+
+    for action in playback.due():
+        terrain.play(action)
+
+    if playback.finished or terrain.play_state:
+        print("End of the replay")
+        playback = None
+
+        # The replay dealt its own win rule,
+        # later games go back to the player's
+        terrain.engine.win_by_reveal = WIN_BY_REVEAL
+
+
+def auto_solve():
+    """ Let the solver play a few moves, and stop
+    auto-solving once it is stuck.
+    """
+
+    for move in range(AUTO_SOLVE_MOVES):
+        if not terrain.play_hint():
+            terrain.auto_solve = False
+            if not terrain.play_state:
+                print("No sure move left, time to guess")
+            break
+
+    keep_recovery()
+
+
+def update(events):
+    """ Run the game logic once over events. Return
+    False if the player quit.
+    """
+
+    is_left_click = False
+    is_right_click = False
+
+    for event in events:
+        if event.type == QUIT:
+            return False
+
+        if event.type == MOUSEBUTTONDOWN and event.button == 2:
+            # The middle button drags the view around,
+            # listen to the mouse moving until it's let go
+            pygame.event.set_allowed(MOUSEMOTION)
+
+        if event.type == MOUSEMOTION and event.buttons[1]:
+            terrain.drag(-event.rel[0], -event.rel[1])
+
+        if event.type == MOUSEBUTTONUP and event.button == 2:
+            pygame.event.set_blocked(MOUSEMOTION)
+
+        if event.type == MOUSEWHEEL:
+            terrain.zoom(event.y, pygame.mouse.get_pos())
+
+        # Wheel turns also come as buttons 4 and 5
+        if event.type == MOUSEBUTTONDOWN and event.button in (1, 3):
+            # Use elif because we only want one button to be
+            # registered at a time
+            if event.button == 1:
+                is_left_click = True
+            elif event.button == 3:
+                is_right_click = True
+
+            # Only need to update on mouse-click
+            terrain.update_plots(
+                is_left_click,
+                is_right_click,
+                pygame.mouse.get_pos()
+            )
+            keep_recovery()
+
+            if layout is not None and layout.fell_back:
+                print(
+                    "No guess-free board found in time, "
+                    "this one may need some guessing"
+                )
+                layout.fell_back = False
+
+        if event.type == KEYDOWN:
+            if event.key == K_F5:
+                if ENDLESS:
+                    print("Endless games can't be saved")
+                else:
+                    try:
+                        save_game(SAVE_FILE)
+                        print("Saved to", SAVE_FILE)
+                    except OSError as error:
+                        print("Could not save the game: {}".format(error))
+            elif event.key == K_F9:
+                load_game(SAVE_FILE)
+            elif event.key == K_h:
+                if terrain.play_hint():
+                    keep_recovery()
+                else:
+                    print("No sure move left, time to guess")
+            elif event.key == K_a:
+                terrain.auto_solve = not terrain.auto_solve
+            elif event.key == K_p:
+                terrain.show_heatmap = not terrain.show_heatmap
+                # Composite everything again, with or without it
+                terrain.backbuffer = None
+            elif event.key in SCROLL_KEYS:
+                terrain.scroll(*SCROLL_KEYS[event.key])
+            elif event.key == K_F3:
+                toggle_overlay()
+            elif event.key == K_F4:
+                makedirs(DATA_PATH, exist_ok=True)
+                profiler.export(PROFILE_FILE)
+                print("Frame timings written to", PROFILE_FILE)
+
+    if playback is not None:
+        replay_moves()
+    if terrain.auto_solve:
+        auto_solve()
+    if profiler.recording:
+        profiler.lap('update_plots')
+
+    manager.update_options(
+        is_left_click,
+        pygame.mouse.get_pos()
+    )
+    if profiler.recording:
+        profiler.lap('update_options')
+
+    manager.update_time()
+    if profiler.recording:
+        profiler.lap('update_time')
+
+    return True
 
 
 def main():
     pygame.init()
 
-    pygame.display.set_icon(ICON)
+    pygame.display.set_icon(pygame.image.load(ICON_PATH))
     display = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE))
     pygame.display.set_caption("PySweeper")
 
-    is_left_click = False
-    is_right_click = False
+    if 'replay' in CONFIG:
+        start_replay(CONFIG['replay'])
+    elif 'load' in CONFIG:
+        load_game(CONFIG['load'])
+    elif path.exists(RECOVERY_FILE):
+        print(
+            "An unfinished game was recovered, resume it with "
+            "`python main.py --load {}`".format(RECOVERY_FILE)
+        )
+
+    # Tiles would load on the first frame anyway,
+    # load them now to report how long startup took
+    PLOT_TILES.load()
+
+    print(
+        "Started in {:.0f} ms ({} start, tiles took {:.0f} ms)".format(
+            (perf_counter() - STARTED) * 1000,
+            'warm' if PLOT_TILES.cache_hit else 'cold',
+            PLOT_TILES.load_time * 1000
+        )
+    )
+
+    # Nothing reacts to the mouse moving but a
+    # drag, so don't wake up for it
+    pygame.event.set_blocked(MOUSEMOTION)
+
+    # Holding an arrow key keeps scrolling
+    pygame.key.set_repeat(250, 40)
+
+    if IDLE_WAIT:
+        # Wake up regularly so that the clock
+        # keeps moving on screen
+        pygame.time.set_timer(CLOCK_EVENT, CLOCK_REFRESH)
+
+    frame_clock = pygame.time.Clock()
 
     while True:
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                pygame.quit()
-                return
-
-            if event.type == MOUSEBUTTONDOWN:
-                # Use elif because we only want one button to be
-                # registered at a time
-                if event.button == 1:
-                    is_left_click = True
-                elif event.button == 3:
-                    is_right_click = True
-
-                # Only need to update on mouse-click
-                terrain.update_plots(
-                    is_left_click,
-                    is_right_click,
-                    pygame.mouse.get_pos()
-                )
+        events = []
 
+        if IDLE_WAIT and not terrain.auto_solve and playback is None:
+            # Sleep until there is input or a clock refresh.
+            # Time asleep doesn't count in the frame
+            events.append(pygame.event.wait())
 
-        manager.update_options(
-            is_left_click,
-            pygame.mouse.get_pos()
-        )
+        profiling = profiler.enabled
+        if profiling:
+            profiler.begin()
 
-        manager.update_time()
+        events.extend(pygame.event.get())
+        if profiling:
+            profiler.lap('events')
 
+        if not update(events):
+            # Quitting on purpose, nothing to recover
+            if not ENDLESS and path.exists(RECOVERY_FILE):
+                remove(RECOVERY_FILE)
 
-        # Switch them so that it doesn't
-        # keep registering clicks
-        is_right_click = False
-        is_left_click = False
+            # Keep the game being left, finished or not
+            terrain.save_replay()
 
+            if layout is not None:
+                layout.close()
+            if ENDLESS:
+                terrain.close()
 
-        # Render queue
-        # Highest last
-        display.fill((10, 10, 10))
-        terrain.render_plots(display)
-        manager.render_statbar(display)
-        manager.render_options(display)
+            profiler.close()
+            if 'profile_trace' in CONFIG:
+                profiler.export(CONFIG['profile_trace'])
 
-        pygame.display.update()
+            pygame.quit()
+            return
+
+        if DIRTY_RENDERING:
+            render_changes(display)
+        else:
+            render_all(display)
+
+        if profiling:
+            profiler.end()
+            if overlay is not None:
+                pygame.display.update(overlay.render(display, profiler))
+
+        # Cap the frame rate while events keep coming
+        frame_clock.tick(FRAMERATE)
 
 
 if __name__ == '__main__':
@@ -6,14 +6,28 @@
 
 # pylint: disable=no-member
 
-from random import randrange, shuffle, choice
+from os import makedirs, path
+from random import choice
+from time import strftime
+import struct
 
-from pygame import font, surface, time
+import numpy as np
 
+import snapshot
+import replay
+
+from pygame import font, surface, time, Rect
+
+from engine import Engine, Action, REVEAL, FLAG, PLAYING, LOST, WON
+from endless import Endless_Engine, DENSITY
+from solver import Solver
+from probability import Probability_Map
+from camera import Camera, zoom_sizes
 from const import (
     TERRAIN_MARGIN, PLOT_PADDING,
-    PLOT_SIZE, PLOT_TILES,
-    FONT_PATH, SCREEN_SIZE
+    PLOT_SIZE, PLOT_TILES, MIN_PLOT_SIZE,
+    FONT_PATH, SCREEN_SIZE, SCROLL_PLOTS,
+    BACKGROUND
 )
 
 
@@ -27,123 +41,119 @@ TITLE_SIZE = int(1 / 8 * SCREEN_SIZE)
 for size in (STAT_SIZE, TITLE_SIZE):
     SF[size] = font.Font(FONT_PATH, size)
 
+# Heat map: colour of a sure mine, and number of
+# shades between that and a sure safe plot
+HEAT_COLOR = (220, 30, 30)
+HEAT_SHADES = 16
+
 
 class Terrain_Manager():
-    """ God oject class that controls generation, allocation
-    and management of the terrain and its plots.
+    """ Pygame frontend for an Engine. Turns clicks into
+    engine actions, and draws the tile id the engine
+    keeps for every plot from the shared tile atlas.
+    topology, seed, mine_quantity, defer_mines,
+    mine_layout and win_by_reveal are passed on to
+    the Engine.
+    Every game is recorded, and its replay written to the
+    replay_path folder once it ends, if there is one.
+    The board is seen through a Camera over the square
+    of side screen_size less the margins, and only the
+    plots in view are drawn.
     """
 
-    def __init__(self, terrain_side):
+    def __init__(
+        self, terrain_side, topology=None,
+        seed=None, mine_quantity=None, defer_mines=False,
+        mine_layout=None, win_by_reveal=False, screen_size=SCREEN_SIZE,
+        replay_path=None
+    ):
         # Terrain side is the number of plots
         # along one side of the game terrain
         self.terrain_side = terrain_side
         self.plot_quantity = terrain_side ** 2
 
-
-        self.has_clicked = False
-        # 0 = playing, 1 = lost, 2 = won
-        self.play_state = 0
-        self.marked_mines = 0
-        self.plots = []
-
-        self.__generate_mine_map()
-        self.__generate_plots()
-
-
-    def __generate_mine_map(self):
-        """ Generate the map of the terrain
-        and fill it randomly with mines.
-        """
-
-        self.mine_quantity = (
-            10 if self.terrain_side == 9 or self.terrain_side == 10
-            else randrange(
-                # Int conversion rounds down
-                int(self.plot_quantity / 7),
-                int(self.plot_quantity / 5)
-            )
+        # Game rules and state
+        self.engine = Engine(
+            terrain_side, topology, seed, mine_quantity, defer_mines,
+            mine_layout, win_by_reveal
         )
+        self.board = self.engine.board
 
-        # List filled with zero. These represent
-        # empty plots. Mines (where the value
-        # is 1) are added later
-        self.mine_map = [0] * self.plot_quantity
+        # Follows every move, for hints and auto-solving
+        self.solver = Solver(self.engine)
+        self.auto_solve = False
 
-        # Add all the mines to the mine map
-        for i in range(self.mine_quantity):
-            self.mine_map[i] = 1
+        # Log of the moves of this game, None when
+        # it isn't being recorded
+        self.replay_path = replay_path
+        self.recorder = replay.Recorder(self.engine)
 
-        for i in range(10):
-            shuffle(self.mine_map)
+        # Mine probabilities, drawn over hidden plots
+        self.odds = Probability_Map(self.solver)
+        self.show_heatmap = False
+        # Translucent squares, by plot size
+        self.heat_tiles = {}
 
+        # Zoomed out to show all of the board if it can be
+        self._init_view(terrain_side, screen_size)
+        self.camera.fit()
 
-    def __generate_plots(self):
-        """ Generate a container object for
-        each plot. These are instances of Plot.
-        """
 
-        # Initial offsets
-        # x and y are pixel coordinates
-        x = y = TERRAIN_MARGIN
+    def _init_view(self, terrain_side, screen_size):
+        """ Set up the viewport, the part of the window the
+        board is seen in, its camera, and the backbuffer.
+        terrain_side is None for an unbounded board.
+        """
 
-        # These are plot quantity offsets.
-        # That is, the number of plots that have
-        # be generated on this row
-        x_offset = y_offset = 0
+        side = screen_size - 2 * TERRAIN_MARGIN
+        self.viewport = Rect(TERRAIN_MARGIN, TERRAIN_MARGIN, side, side)
+        self.camera = Camera(
+            terrain_side, self.viewport, PLOT_SIZE, PLOT_PADDING,
+            zoom_sizes(PLOT_SIZE, min(MIN_PLOT_SIZE, PLOT_SIZE))
+        )
 
-        current_row_plotcount = 0
+        # Persistent surface the whole board is composited
+        # into, built on the first dirty-rectangle render
+        self.backbuffer = None
 
-        # Row level, starting from the top
-        level = 1
 
-        for i in range(self.plot_quantity):
+    @property
+    def has_clicked(self):
+        return self.engine.has_clicked
 
-            plot = Plot(
-                self.mine_map[i],
-                x, y,
-                x_offset, y_offset
-            )
-            self.plots.append(plot)
+    @property
+    def play_state(self):
+        # 0 = playing, 1 = lost, 2 = won
+        return self.engine.play_state
 
-            # Offset between each plot
-            x += PLOT_PADDING + PLOT_SIZE
-            x_offset += 1
-            current_row_plotcount += 1
+    @property
+    def marked_mines(self):
+        return self.engine.marked_mines
 
-            # As soon as the terrain side quantity has been
-            # generated once, descend one level, and repeat
-            if current_row_plotcount == self.terrain_side:
+    @property
+    def mine_quantity(self):
+        return self.engine.mine_quantity
 
-                # Adjust and reset offsets
-                x = TERRAIN_MARGIN
-                x_offset = 0
-                y_offset += 1
+    @property
+    def seed(self):
+        return self.engine.seed
 
-                y = TERRAIN_MARGIN + level * (PLOT_SIZE +
-                    PLOT_PADDING)
+    @property
+    def counter(self):
+        # Label and value of the status bar counter
+        return 'Mines', self.mine_quantity - self.marked_mines
 
-                current_row_plotcount = 0
-                level += 1
+    @property
+    def plots_in_view(self):
+        x_start, x_stop, y_start, y_stop = self.camera.visible()
+        return (x_stop - x_start) * (y_stop - y_start)
 
 
     def _print_mine_map(self):
         """ Print minemap, formatted to match terrain. """
 
-        self.mine_map = []
-
-        # Update minemap
-        for plot in self.plots:
-            if plot.type == 1:
-                self.mine_map.append(1)
-            else:
-                self.mine_map.append(0)
-
-        for i in range(self.terrain_side):
-            print(
-                self.mine_map[
-                    i * self.terrain_side
-                    : i * self.terrain_side + self.terrain_side
-                ])
+        for row in self.board.mines:
+            print(row.tolist())
 
 
     def get_stats(self, minemap=False):
@@ -156,15 +166,180 @@ class Terrain_Manager():
 
         return [
             self.terrain_side, self.plot_quantity,
-            self.mine_quantity, self.marked_mines
+            self.mine_quantity, self.marked_mines, self.seed
         ]
 
 
     def render_plots(self, display):
-        """ Blit all plots to display. """
+        """ Blit the plots in view to display. """
+
+        camera = self.camera
+        atlas, areas = PLOT_TILES.scaled(camera.plot_size)
+
+        x_start, x_stop, y_start, y_stop = camera.visible()
+        left, top = camera.position(x_start, y_start)
+        step = camera.step
+        xs = range(left, left + (x_stop - x_start) * step, step)
+
+        rows = self.tiles_in_view(x_start, x_stop, y_start, y_stop).tolist()
+
+        # Plots cut by the edges of the view
+        # must not spill into the margins
+        clip = display.get_clip()
+        display.set_clip(self.viewport)
+
+        display.blits([
+            (atlas, (x, top + row * step), areas[tile])
+            for row, tiles in enumerate(rows)
+            for x, tile in zip(xs, tiles)
+        ], False)
+
+        display.set_clip(clip)
+
+
+    def render_heatmap(self, display):
+        """ Shade every hidden plot in view in red, the
+        more likely it is to hold a mine the redder.
+        Nothing is shaded once the game is over.
+        """
+
+        if self.play_state != PLAYING:
+            return
 
-        for plot in self.plots:
-            display.blit(plot.surface, (plot.rect.x, plot.rect.y))
+        camera = self.camera
+        size = camera.plot_size
+
+        if size not in self.heat_tiles:
+            # One translucent square per shade
+            self.heat_tiles[size] = []
+            for shade in range(HEAT_SHADES + 1):
+                tile = surface.Surface((size, size))
+                tile.fill(HEAT_COLOR)
+                tile.set_alpha(int(200 * shade / HEAT_SHADES))
+                self.heat_tiles[size].append(tile)
+
+        heat_tiles = self.heat_tiles[size]
+
+        x_start, x_stop, y_start, y_stop = camera.visible()
+        probabilities = self.odds.compute()[y_start:y_stop, x_start:x_stop]
+        ys, xs = np.nonzero(~np.isnan(probabilities))
+        shades = np.rint(probabilities[ys, xs] * HEAT_SHADES).astype(int)
+
+        clip = display.get_clip()
+        display.set_clip(self.viewport)
+
+        display.blits([
+            (heat_tiles[shade], camera.position(x_start + x, y_start + y))
+            for x, y, shade in zip(xs.tolist(), ys.tolist(), shades.tolist())
+        ], False)
+
+        display.set_clip(clip)
+
+
+    def render_backbuffer(self, display):
+        """ Bring the backbuffer up to date, rebuilding it
+        if needed, and blit all of it to display.
+        """
+
+        if self.backbuffer is None:
+            self.backbuffer = surface.Surface(display.get_size())
+            self.backbuffer.fill(BACKGROUND)
+            self.backbuffer.set_clip(self.viewport)
+            self.render_plots(self.backbuffer)
+            self.board.changed.clear()
+        else:
+            self.render_changes(self.backbuffer)
+
+        display.blit(self.backbuffer, (0, 0))
+
+
+    def render_changes(self, display):
+        """ Blit the plots in view that changed since the
+        last call to the backbuffer and to display. Return
+        the list of rects that were touched.
+        """
+
+        camera = self.camera
+        changed = self.board.changed
+        x_start, x_stop, y_start, y_stop = camera.visible()
+
+        if len(changed) > self.plots_in_view:
+            # A cascade or a new game, drawing
+            # the whole view again is cheaper
+            self.render_plots(self.backbuffer)
+            changed.clear()
+            if display is not self.backbuffer:
+                display.blit(self.backbuffer, self.viewport, self.viewport)
+            return [self.viewport.copy()]
+
+        atlas, areas = PLOT_TILES.scaled(camera.plot_size)
+
+        rects = []
+
+        for x_offset, y_offset, tile in self.changed_tiles():
+            if not (
+                x_start <= x_offset < x_stop and y_start <= y_offset < y_stop
+            ):
+                continue
+
+            # The backbuffer clips to the view, display
+            # takes the clipped rect from it
+            rect = self.backbuffer.blit(
+                atlas, camera.position(x_offset, y_offset), areas[tile]
+            )
+            if display is not self.backbuffer:
+                display.blit(self.backbuffer, rect, rect)
+            rects.append(rect)
+
+        changed.clear()
+
+        return rects
+
+
+    def tiles_in_view(self, x_start, x_stop, y_start, y_stop):
+        """ Return the tile ids of the plots in the given
+        offset ranges, as an array indexed [y, x].
+        """
+
+        return self.board.tiles[y_start:y_stop, x_start:x_stop]
+
+
+    def changed_tiles(self):
+        """ Return the (x_offset, y_offset, tile) of
+        every plot in board.changed.
+        """
+
+        side = self.terrain_side
+        tiles = self.board.tiles.ravel()
+
+        return [
+            (i % side, i // side, int(tiles[i])) for i in self.board.changed
+        ]
+
+
+    def scroll(self, dx, dy):
+        """ Scroll the view by SCROLL_PLOTS plots
+        dx times across and dy times down.
+        """
+
+        step = SCROLL_PLOTS * self.camera.step
+        self.drag(dx * step, dy * step)
+
+
+    def drag(self, dx, dy):
+        """ Scroll the view by dx, dy pixels. """
+
+        if self.camera.scroll(dx, dy):
+            self.backbuffer = None
+
+
+    def zoom(self, steps, mouse_pos):
+        """ Zoom in by steps levels (out if negative)
+        around the pixel coordinates mouse_pos.
+        """
+
+        if self.camera.zoom(steps, mouse_pos):
+            self.backbuffer = None
 
 
     def update_plots(self, lmouse, rmouse, mouse_pos):
@@ -175,234 +350,137 @@ class Terrain_Manager():
         if self.play_state:
             return
 
-        for plot in self.plots:
-            if not plot.revealed:
-                if lmouse:
-                    if plot.state == 0:
-                        if plot.rect.collidepoint(mouse_pos):
-
-                            if not self.has_clicked:
-                                # Player can't die on first click.
-                                # Clear plot and zone around it
-                                # to make sure it's not
-                                # impossible
-                                self.clear_area(plot)
-                                self.has_clicked = True
-
-
-                            # Clicked on mined plot
-                            if plot.type == 1:
-                                plot.reveal(14)
-                                print('You died!')
-                                self.reveal_all()
-                                self.play_state = 1
-                                # Return so it doesn't
-                                # repaint over
-                                return
-
-                            adjacent = self.get_adjacent_mines(plot)
-                            if adjacent == 0:
-                                # No adjacent mines, check further
-                                self.reveal_adjacent_plots(plot)
-
-                            # Reveal plot according to quantity
-                            # of surrounding mines
-                            plot.reveal(adjacent)
-
-                elif rmouse:
-                    if plot.rect.collidepoint(mouse_pos):
-                        state = plot.toggle_state()
-                        if state == 1:
-                            self.marked_mines += 1
-                        elif state == 2:
-                            self.marked_mines -= 1
-
-                    # Game can only be won from a right-click
-                    self.check_victory()
-
-
-    def clear_area(self, plot):
-        """ Move a mine from a plot to another one.
-        Only used once per game, if the player's first
-        click is on a mine.
-        """
+        # Only the plot under the cursor can react
+        plot = self.get_plot_at(mouse_pos)
 
-        zone = [
-            plot for plot in self.get_adjacent_plots(plot)
-        ]
-        # Don't omit clicked plot
-        zone.append(plot)
-
-        moved = 0
-
-        for plot in zone:
-            if plot.type == 1:
-                moved += 1
-                while True:
-                    new_target = self.get_plot(
-                        randrange(0, self.terrain_side),
-                        randrange(0, self.terrain_side)
-                    )
-                    if (
-                        new_target not in zone
-                        and new_target.type == 0
-                    ):
-                        new_target.type = 1
-                        plot.type = 0
-                        break
-
-        # print("Relocated {} mine{}".format(
-        #     moved, 's' if moved != 1 else '')
-        # )
-
-
-    def get_adjacent_plots(self, plot):
-        """ Return a list with all adjacent plots. """
-
-        x = plot.x_offset
-        y = plot.y_offset
-
-        # [x_offset_shift, y_offset_shift]
-        adjacent_offsets = {
-            1: [-1, -1], 2: [0, -1], 3: [1, -1],
-            4: [-1, 0],              5: [1, 0],
-            6: [-1, 1],  7: [0, 1],  8: [1, 1]
-        }
-
-        adjacent_plots = []
-
-        # Shift all offsets to be relative to the clicked plot
-        for pair in adjacent_offsets:
-            adjacent_offsets[pair][0] += x
-            adjacent_offsets[pair][1] += y
-
-        # Get all adjacent plots according to x and y offsets
-        # gotten from adjacent_offset. The last bit, `if plot`,
-        # removes None elements, as they equate to False,
-        # that get returned by get_plot when it finds no matches.
-        # This happens because plots offsets can be out of bounds
-        adjacent_plots = [
-            plot for plot in [
-                self.get_plot(
-                    adjacent_offsets[pair][0],
-                    adjacent_offsets[pair][1]
-                ) for pair in adjacent_offsets
-            ] if plot
-        ]
+        if plot is None:
+            return
 
-        return adjacent_plots
+        if lmouse:
+            self.play(Action(REVEAL, plot.index))
+        elif rmouse:
+            self.play(Action(FLAG, plot.index))
+
+
+    def play(self, action):
+        """ Record action, and play it. """
+
+        if self.recorder is not None:
+            self.recorder.record(action)
 
+        self.apply(self.engine.act(action))
 
-    def get_adjacent_mines(self, plot):
-        """ Return the quantity of mines adjacent
-        to plot.
+
+    def apply(self, result):
+        """ Report the outcome of an engine Result. The tiles
+        it lists are already on the board for rendering.
         """
 
-        return len([
-            plot for plot in
-            self.get_adjacent_plots(plot)
-            if plot.type == 1
-        ])
+        self.solver.update(result)
 
+        if result.play_state == LOST:
+            print('You died!')
+        elif result.play_state == WON:
+            print('You did it!')
 
-    def get_plot(self, x_offset, y_offset):
-        """ Returns the plot that matches the given x_offset
-        and y_offset, returns None if none were found.
+        if result.play_state:
+            self.save_replay()
+
+
+    def save_replay(self):
+        """ Write the replay of the current game to
+        replay_path, if anything was played in it, and
+        stop recording it.
         """
 
-        shift = (y_offset * self.terrain_side) + x_offset
+        recorder = self.recorder
+        self.recorder = None
 
-        if (
-            # Ensure the plot is the one we're after
-            shift < self.plot_quantity
-            and self.plots[shift].x_offset == x_offset
-            and self.plots[shift].y_offset == y_offset
-        ):
-            return self.plots[shift]
+        if self.replay_path is None or recorder is None:
+            return
+        if not recorder.records:
+            return
+
+        file_path = path.join(self.replay_path, '{}-{}.psr'.format(
+            strftime('%Y%m%d-%H%M%S'), self.seed
+        ))
 
+        try:
+            makedirs(self.replay_path, exist_ok=True)
+            replay.save(file_path, recorder)
+        except (OSError, struct.error) as error:
+            print("Could not save the replay: {}".format(error))
 
-    def reveal_adjacent_plots(self, plot):
-        """ Reveal all adjacent plots, and those adjacent
-        to them, until all plots are adjacent to mines.
+
+    def play_hint(self):
+        """ Play the next move the solver is sure of.
+        Return False if there is none, or the game is over.
         """
 
-        adjacent_to = self.get_adjacent_plots
-        adjacent_mines_to = self.get_adjacent_mines
+        if self.play_state:
+            return False
 
-        plot_queue = adjacent_to(plot)
-        next_queue = []
+        action = self.solver.hint()
 
-        # Empty iterables are False (PEP8)
-        while plot_queue:
+        if action is None:
+            return False
 
-            for plot in plot_queue:
-                if not plot.revealed:
+        self.play(action)
+        return True
 
-                    if adjacent_mines_to(plot) == 0:
-                        plot.reveal(0)
 
-                        for adj_plot in adjacent_to(plot):
-                            if adj_plot not in next_queue:
-                                next_queue.append(adj_plot)
+    def get_plot_at(self, mouse_pos):
+        """ Return the plot under the pixel coordinates
+        mouse_pos, or None if they land in the margin
+        or in the padding between two plots.
+        """
 
-                    else:
-                        plot.reveal(adjacent_mines_to(plot))
+        offsets = self.camera.plot_at(mouse_pos)
 
-            plot_queue = [
-                plot for plot in next_queue if
-                plot not in plot_queue
-            ]
-            next_queue = []
+        if offsets is None:
+            return None
 
+        return self.get_plot(*offsets)
 
-    def check_victory(self):
-        """ Check if the player has won, by verifying that
-        exclusively all plots with mines have been marked.
+
+    def get_plot(self, x_offset, y_offset):
+        """ Returns the plot that matches the given x_offset
+        and y_offset, returns None if none were found.
         """
 
-        if self.marked_mines == self.mine_quantity:
-            # If the player has marked all mines properly,
-            # this should return True
-            if all([
-                plot.type for plot in self.plots
-                if plot.state == 1
-            ]):
-                print('You did it!')
-                self.play_state = 2
-                self.reveal_all()
+        if (
+            0 <= x_offset < self.terrain_side
+            and 0 <= y_offset < self.terrain_side
+        ):
+            return Plot(self.board, x_offset, y_offset, self.camera)
 
 
-    def reveal_all(self):
-        """ Unveil all the plots. """
+    def load(self, file_path):
+        """ Replace the current game with the snapshot saved
+        in file_path. Return the timer saved with it.
+        """
+
+        with open(file_path, 'rb') as saved:
+            timer = snapshot.restore(self.engine, saved.read())
 
-        for plot in self.plots:
-            if not plot.revealed:
+        self.solver.reset()
+        self.backbuffer = None
 
-                # If the plot had a mine
-                if plot.type == 1:
-                    # But was not marked
-                    if plot.state == 0:
-                        plot.reveal(11)
-                    # But was marked
-                    elif plot.state == 1:
-                        plot.reveal(13)
+        # The replay would miss the moves before the save
+        self.recorder = None
 
-                # If the plot was safe but was marked
-                elif plot.type == 0 and plot.state == 1:
-                    plot.reveal(12)
-                else:
-                    plot.reveal(self.get_adjacent_mines(plot))
+        return timer
 
 
     def restart(self):
         """ Restart new game. """
-        self.has_clicked = False
-        self.play_state = 0
-        self.marked_mines = 0
-        self.plots = []
+        # Keep the game being left, finished or not
+        self.save_replay()
 
-        self.__generate_mine_map()
-        self.__generate_plots()
+        self.engine.new_game()
+        self.solver.reset()
+        self.backbuffer = None
+        self.recorder = replay.Recorder(self.engine)
 
         print(choice([
             "Here we go again!",
@@ -412,63 +490,174 @@ class Terrain_Manager():
             "And another one!",
             "There's just no stopping you, is there?",
             "GOGOGO!"
-        ]))
+        ]), "(seed {})".format(self.seed))
+
+
+class Endless_Manager(Terrain_Manager):
+    """ Pygame frontend for an Endless_Engine, drawn and
+    steered like a Terrain_Manager through an unbounded
+    camera that opens on the origin. seed and density are
+    passed on to the Endless_Engine. There is no solver,
+    heat map or saving on an endless board.
+    """
+
+    def __init__(self, seed=None, density=DENSITY, screen_size=SCREEN_SIZE):
+        self.terrain_side = None
+
+        self.engine = Endless_Engine(seed, density)
+
+        self.solver = None
+        self.auto_solve = False
+        self.show_heatmap = False
+
+        # Endless games aren't recorded
+        self.replay_path = None
+        self.recorder = None
+
+        self._init_view(None, screen_size)
+        self.camera.look_at(0, 0)
+
+
+    @property
+    def board(self):
+        # Every game gets a board of its own
+        return self.engine.board
+
+    @property
+    def counter(self):
+        return 'Cleared', self.engine.revealed_plots
+
+
+    def get_stats(self, minemap=False):
+        """ Return the seed, the mine density and the
+        quantity of plots cleared so far.
+        """
+
+        return [self.seed, self.engine.density, self.engine.revealed_plots]
+
+
+    def render_heatmap(self, display):
+        """ Endless boards have no heat map. """
+
+
+    def tiles_in_view(self, x_start, x_stop, y_start, y_stop):
+        return self.board.window(x_start, x_stop, y_start, y_stop)
+
+
+    def changed_tiles(self):
+        tile = self.board.tile
+        return [(x, y, tile(x, y)) for x, y in self.board.changed]
+
+
+    def update_plots(self, lmouse, rmouse, mouse_pos):
+        """ Update plots according to user interaction. """
+
+        if self.play_state:
+            return
+
+        plot = self.camera.plot_at(mouse_pos)
+
+        if plot is None:
+            return
+
+        if lmouse:
+            self.apply(self.engine.act(Action(REVEAL, plot)))
+        elif rmouse:
+            self.apply(self.engine.act(Action(FLAG, plot)))
+
+
+    def apply(self, result):
+        """ Report the outcome of an engine Result. """
+
+        if result.play_state == LOST:
+            print(
+                'You died, after clearing {} plots!'.format(
+                    self.engine.revealed_plots
+                )
+            )
+
+
+    def play_hint(self):
+        """ There are no hints on an endless board. """
+
+        return False
+
+
+    def get_plot(self, x_offset, y_offset):
+        """ Plots only exist on a Board, return None. """
+
+        return None
+
+
+    def load(self, file_path):
+        raise ValueError('endless games cannot be saved or loaded')
+
+
+    def restart(self):
+        """ Start a new world, back at its origin. """
+
+        self.engine.new_game()
+        self.camera.look_at(0, 0)
+        self.backbuffer = None
+
+        print("A whole new world! (seed {})".format(self.seed))
+
+
+    def close(self):
+        """ Remove the chunks spilled to disk. """
+
+        self.engine.close()
 
 
 class Plot():
     """ Class that represents each individual plot.
     Type can be 0 or 1: empty or mined.
-    x and y are the plot's rect's coordinates.
     x_offset is the plot horizontal offset, starting
     from the left (0) and ending with SIDE - 1.
     y_offset is the same as x_offset, but vertically.
+    Type, state, revealed and the tile id shown live in
+    the shared board, and are read only: changes go
+    through the Engine, which keeps its counters and the
+    board's changed set in step. A plot holds no pixels
+    itself, and is placed on screen by the camera. Plots are made on
+    demand, boards can hold millions of them.
     """
 
-    def __init__(self, type, x, y, x_offset, y_offset):
-        self.state = 0
-        self.type = type
-        self.surface = surface.Surface((PLOT_SIZE, PLOT_SIZE))
-        self.rect = self.surface.get_rect(topleft=(x, y))
-        self.surface.fill((100, 100, 100))
+    __slots__ = ('board', 'index', 'x_offset', 'y_offset', 'camera')
+
+    def __init__(self, board, x_offset, y_offset, camera):
+        self.board = board
+        self.index = y_offset * board.terrain_side + x_offset
         self.x_offset, self.y_offset = x_offset, y_offset
-        self.revealed = False
+        self.camera = camera
 
 
-    def reveal(self, tile):
-        """ Reveal the contents of the plot by updating
-        plot tile to display PLOT_TILES[tile].
-        """
-        self.revealed = True
-        # The destination coordinates are relative to
-        # the plot's surface.
-        self.surface.blit(PLOT_TILES[tile], (0, 0))
+    @property
+    def rect(self):
+        size = self.camera.plot_size
+        return Rect(
+            self.camera.position(self.x_offset, self.y_offset), (size, size)
+        )
 
 
-    def toggle_state(self):
-        """ Toggle between plot tile states.
-        Returns 0 if unmarked, 1 if marked,
-        or 2 if unknown.
-        """
+    @property
+    def tile(self):
+        return int(self.board.tiles[self.y_offset, self.x_offset])
 
-        self.state += 1
-        self.state %= 3
-        self._update_tile()
 
-        return self.state
+    @property
+    def type(self):
+        return int(self.board.mines[self.y_offset, self.x_offset])
 
 
-    def _update_tile(self):
-        """ Update tile according to state. """
+    @property
+    def state(self):
+        return int(self.board.flags[self.y_offset, self.x_offset])
 
-        # Unmarked
-        if self.state == 0:
-            self.surface.fill((100, 100, 100))
-        # Flagged
-        elif self.state == 1:
-            self.surface.blit(PLOT_TILES[9], (0, 0))
-        # Unknown
-        else:
-            self.surface.blit(PLOT_TILES[10], (0, 0))
+
+    @property
+    def revealed(self):
+        return bool(self.board.revealed[self.y_offset, self.x_offset])
 
 
 class Stat_Manager():
@@ -487,6 +676,15 @@ class Stat_Manager():
         self.board_shown = False
         self.mouse_freed = False
 
+        # Status bar text is drawn from pre-rendered glyphs
+        self.statbar_glyphs = Glyph_Cache(SF[STAT_SIZE], (255, 255, 255))
+
+        # Last state drawn by the dirty-rectangle renderer
+        self.statbar_rect = Rect(0, 0, self.size, TERRAIN_MARGIN)
+        self.statbar_values = None
+        self.statbar_text = None
+        self.options_shown = None
+
         self.__render_options()
 
 
@@ -517,6 +715,20 @@ class Stat_Manager():
             self.time['s'] = 0.0
 
 
+    def get_timer(self):
+        """ Return the time played, in milliseconds. """
+
+        return int(self.time['m'] * 60000 + self.time['s'])
+
+
+    def set_timer(self, timer):
+        """ Set the time played to timer milliseconds. """
+
+        minutes, seconds = divmod(timer, 60000)
+        self.time['m'] = minutes
+        self.time['s'] = float(seconds)
+
+
     def _render(self, text, font, color, bcolor=None):
         """ Return a surface on which `text` is rendered. """
 
@@ -602,49 +814,99 @@ class Stat_Manager():
             }
 
 
-    def render_statbar(self, target):
-        """ Blit all status bar elements to target. """
+    def _statbar_values(self):
+        """ Return the clock minutes and seconds, and the
+        label and value of the terrain's counter (mines left
+        to mark, or plots cleared on an endless board).
+        """
+
+        return (
+            (self.time['m'], int(self.time['s'] / 1000))
+            + tuple(self.terrain.counter)
+        )
+
+
+    def _statbar_text(self, values):
+        """ Return the clock and mine counter strings. """
 
         ls = lambda x: len(str(x))
 
-        time = self._render(
-            '{0}{2}:{1}{3}'.format(
-                # The replacements 0 and 1 are to add
-                # leading zeroes to the clock seconds,
-                # so it does not shift around
-                '0' if ls(self.time['m']) < 2 else '',
-                '0' if ls(int(self.time['s'] / 1000)) < 2 else '',
-                self.time['m'], int(self.time['s'] / 1000)
-            ),
-            SF[STAT_SIZE], (255, 255, 255)
-        )
+        minutes, seconds, label, mm = values
 
-        stats = self.terrain.get_stats()
-        mm = stats[2] - stats[3]
+        time = '{0}{2}:{1}{3}'.format(
+            # The replacements 0 and 1 are to add
+            # leading zeroes to the clock seconds,
+            # so it does not shift around
+            '0' if ls(minutes) < 2 else '',
+            '0' if ls(seconds) < 2 else '',
+            minutes, seconds
+        )
 
-        marked = self._render(
-            "Mines: {}{}".format(
-                # Add space so it doesn't
-                # constantly shift around
-                ' ' * (2 - ls(mm)),
-                mm,
-            ),
-            SF[STAT_SIZE], (255, 255, 255)
+        marked = "{}: {}{}".format(
+            label,
+            # Add space so it doesn't
+            # constantly shift around
+            ' ' * (2 - ls(mm)),
+            mm,
         )
 
-        height = (TERRAIN_MARGIN - time.get_height()) / 2
+        return time, marked
+
+
+    def render_statbar(self, target):
+        """ Blit all status bar elements to target. """
+
+        values = self._statbar_values()
 
-        target.blit(time, (TERRAIN_MARGIN, height))
-        target.blit(
-            marked, (
+        # Only format the labels again when their values change
+        if values != self.statbar_values:
+            self.statbar_values = values
+            self.statbar_text = self._statbar_text(values)
+
+        time, marked = self.statbar_text
+        glyphs = self.statbar_glyphs
+
+        height = (TERRAIN_MARGIN - glyphs.height) / 2
+
+        glyphs.blit(target, time, (TERRAIN_MARGIN, height))
+        glyphs.blit(
+            target, marked, (
                 self.size
                 - TERRAIN_MARGIN
-                - marked.get_width(),
+                - glyphs.width(marked),
                 height
             )
         )
 
 
+    def render_statbar_changes(self, target):
+        """ Redraw the status bar only if its text changed.
+        Return the list of rects that were touched.
+        """
+
+        if self._statbar_values() == self.statbar_values:
+            return []
+
+        target.fill(BACKGROUND, self.statbar_rect)
+        self.render_statbar(target)
+        # The return button sits in the status bar
+        self.render_options(target)
+
+        return [self.statbar_rect]
+
+
+    def options_changed(self):
+        """ Return True if the options on screen are not
+        the same as on the last call.
+        """
+
+        shown = (self.terrain.play_state, self.board_shown)
+        changed = shown != self.options_shown
+        self.options_shown = shown
+
+        return changed
+
+
     def render_options(self, target):
         """ Blit all options to target, if player has
         won or lost. """
@@ -696,3 +958,109 @@ class Stat_Manager():
                             self.mouse_freed = False
                         if b == 'b':
                             self.board_shown = True
+
+
+class Profile_Overlay():
+    """ Frame timings drawn over the bottom margin: the
+    last frame time, percentiles and blits per frame, then
+    the mean time of every phase, in milliseconds.
+    """
+
+    # Short names of the Frame_Profiler phases
+    LABELS = (
+        ('events', 'ev'), ('update_plots', 'upd'),
+        ('update_options', 'opt'), ('update_time', 'time'),
+        ('render_plots', 'plots'), ('render_statbar', 'stat'),
+        ('display_update', 'flip')
+    )
+
+    def __init__(self, display_size):
+        self.rect = Rect(
+            0, display_size - TERRAIN_MARGIN, display_size, TERRAIN_MARGIN
+        )
+
+        # Two lines in the margin
+        self.glyphs = Glyph_Cache(
+            font.Font(FONT_PATH, max(8, TERRAIN_MARGIN // 3)),
+            (180, 180, 180), ''
+        )
+
+
+    def render(self, display, profiler):
+        """ Draw the timings of profiler, a Frame_Profiler,
+        to display. Return the rect drawn over.
+        """
+
+        if not profiler.frames:
+            return self.rect
+
+        means = profiler.means()
+        last = profiler.frames[-1]['frame'] / 1e6
+
+        lines = (
+            '{:.2f} ms  p50 {:.2f}  p95 {:.2f}  p99 {:.2f}  '
+            '{:.0f} blits'.format(
+                last, *profiler.percentiles(), means['blits']
+            ),
+            '  '.join(
+                '{} {:.2f}'.format(label, means[phase])
+                for phase, label in self.LABELS
+            )
+        )
+
+        display.fill(BACKGROUND, self.rect)
+
+        for row, text in enumerate(lines):
+            self.glyphs.blit(display, text, (
+                self.rect.x + 4, self.rect.y + row * self.glyphs.height
+            ))
+
+        return self.rect
+
+
+class Glyph_Cache():
+    """ Pre-rendered glyphs of one font in one colour.
+    Text is drawn by blitting them side by side, which
+    is only right for a monospaced font like SF Mono.
+    """
+
+    def __init__(self, font, color, characters='0123456789: '):
+        self.font = font
+        self.color = color
+        self.height = font.get_height()
+        self.glyphs = {}
+
+        for character in characters:
+            self.glyph(character)
+
+
+    def glyph(self, character):
+        """ Return the surface for character, rendering
+        it the first time it is asked for.
+        """
+
+        if character not in self.glyphs:
+            self.glyphs[character] = self.font.render(
+                character, True, self.color
+            )
+
+        return self.glyphs[character]
+
+
+    def width(self, text):
+        """ Return the width text takes up, in pixels. """
+
+        return sum(self.glyph(c).get_width() for c in text)
+
+
+    def blit(self, target, text, position):
+        """ Blit text to target, with its top left
+        corner at position.
+        """
+
+        x, y = position
+
+        for character in text:
+            glyph = self.glyph(character)
+            target.blit(glyph, (x, y))
+            x += glyph.get_width()
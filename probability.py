@@ -0,0 +1,333 @@
+""" Exact mine probabilities for PySweeper.
+
+Built on the Solver: plots it is sure of are 0 or 1, the
+rest of the frontier is split into independent components
+(unknown plots linked through the numbers around them).
+Each component is enumerated by backtracking over its
+plots, memoized on the needs of the numbers still open, so
+that it yields how many layouts have m mines and how many
+of those put a mine on each plot. Components are then
+combined under the total mine count, every plot away from
+the frontier sharing the same odds, by weighting each
+total with the number of ways to place the mines left
+over there.
+Components that did not change since the last call are
+not enumerated again. Like engine, this module does not
+need pygame.
+"""
+
+from math import lgamma, exp
+
+import numpy as np
+
+
+def _add(target, poly, shift):
+    """ Add poly, multiplied by x ** shift, to target. """
+
+    if len(target) < len(poly) + shift:
+        target.extend([0] * (len(poly) + shift - len(target)))
+
+    for m, count in enumerate(poly):
+        target[m + shift] += count
+
+
+def _convolve(first, second):
+    """ Return the product of two polynomials. """
+
+    product = [0] * (len(first) + len(second) - 1)
+
+    for i, a in enumerate(first):
+        if a:
+            for j, b in enumerate(second):
+                product[i + j] += a * b
+
+    return product
+
+
+def enumerate_component(rules):
+    """ Count the mine layouts of one component. rules is a
+    list of (plots, mines) pairs: exactly mines of the
+    unknown plots in plots hold a mine. Return the plots,
+    totals and weights, where totals[m] is the number of
+    layouts with m mines and weights[i][m] the number of
+    those with a mine on plots[i].
+    """
+
+    owners = {}
+    for rule, (plots, mines) in enumerate(rules):
+        for plot in plots:
+            owners.setdefault(plot, []).append(rule)
+
+    # Breadth first order, so that numbers are
+    # closed soon after they are opened
+    plots = [min(rules[0][0])]
+    ordered = {plots[0]}
+
+    for plot in plots:
+        for rule in owners[plot]:
+            for other in sorted(rules[rule][0]):
+                if other not in ordered:
+                    ordered.add(other)
+                    plots.append(other)
+
+    size = len(plots)
+    position = {plot: i for i, plot in enumerate(plots)}
+
+    # For every plot, the rules it belongs to and how many
+    # of their plots come after it
+    after = [[] for plot in plots]
+    first = []
+    last = []
+
+    for rule, (members, mines) in enumerate(rules):
+        spots = sorted(position[plot] for plot in members)
+        first.append(spots[0])
+        last.append(spots[-1])
+        for rest, spot in enumerate(reversed(spots)):
+            after[spot].append((rule, rest))
+
+    # Rules opened but not closed before each plot
+    open_rules = [
+        [rule for rule in range(len(rules)) if first[rule] < i <= last[rule]]
+        for i in range(size + 1)
+    ]
+
+    def step(i, state, value):
+        needs = dict(zip(open_rules[i], state))
+
+        for rule, rest in after[i]:
+            need = needs.get(rule, rules[rule][1]) - value
+            if need < 0 or need > rest:
+                return None
+            needs[rule] = need
+
+        return tuple(needs[rule] for rule in open_rules[i + 1])
+
+    # Ways to reach each state, by mines placed so far
+    forward = [{(): [1]}]
+    steps = []
+
+    for i in range(size):
+        layer = {}
+        moves = {}
+        for state, poly in forward[i].items():
+            moves[state] = (step(i, state, 0), step(i, state, 1))
+            for value, target in enumerate(moves[state]):
+                if target is not None:
+                    _add(layer.setdefault(target, []), poly, value)
+        forward.append(layer)
+        steps.append(moves)
+
+    # Ways to finish from each state, by mines still to place
+    backward = {(): [1]} if () in forward[size] else {}
+    weights = [None] * size
+
+    for i in reversed(range(size)):
+        layer = {}
+        weight = []
+        for state, (zero, one) in steps[i].items():
+            poly = []
+            if zero in backward:
+                _add(poly, backward[zero], 0)
+            if one in backward:
+                _add(poly, backward[one], 1)
+                _add(weight, _convolve(forward[i][state], backward[one]), 1)
+            if poly:
+                layer[state] = poly
+        backward = layer
+        weights[i] = weight
+
+    return plots, backward.get((), [0]), weights
+
+
+class Probability_Map():
+    """ Mine probabilities for the game followed by solver,
+    a Solver. See compute().
+    """
+
+    def __init__(self, solver):
+        self.solver = solver
+
+        # Enumerated components, by their rules
+        self.components = {}
+
+
+    def __rules(self):
+        """ Return the frontier split into components, each a
+        sorted list of (number index, unknown plots, mines).
+        """
+
+        solver = self.solver
+        rules = {}
+
+        for index in solver.frontier:
+            plots, mines = solver.constraint(index)
+            if plots:
+                rules[index] = (plots, mines)
+
+        owners = {}
+        for index, (plots, mines) in rules.items():
+            for plot in plots:
+                owners.setdefault(plot, []).append(index)
+
+        components = []
+        seen = set()
+
+        for start in sorted(rules):
+            if start in seen:
+                continue
+
+            seen.add(start)
+            members = [start]
+
+            for index in members:
+                for plot in rules[index][0]:
+                    for other in owners[plot]:
+                        if other not in seen:
+                            seen.add(other)
+                            members.append(other)
+
+            components.append([
+                (index, tuple(sorted(rules[index][0])), rules[index][1])
+                for index in sorted(members)
+            ])
+
+        return components
+
+
+    def __enumerate(self, component, cache):
+        """ Return the plots, totals and weights of
+        component, scaled to a total of 1.
+        """
+
+        key = tuple(component)
+
+        if key not in self.components:
+            plots, totals, weights = enumerate_component([
+                (plots, mines) for index, plots, mines in component
+            ])
+
+            scale = sum(totals)
+            if not scale:
+                raise ValueError('Numbers on the board contradict each other')
+
+            self.components[key] = (
+                plots,
+                np.array([count / scale for count in totals]),
+                [
+                    np.array([count / scale for count in weight]
+                             + [0.0] * (len(totals) - len(weight)))
+                    for weight in weights
+                ]
+            )
+
+        cache[key] = self.components[key]
+        return cache[key]
+
+
+    def compute(self):
+        """ Return an array, indexed [y, x] like the Board's,
+        of the probability that each hidden plot holds a mine.
+        Revealed plots are NaN, all of them once the board
+        has no hidden plot left.
+        """
+
+        solver = self.solver
+        engine = solver.engine
+        board = engine.board
+
+        hidden = ~board.revealed.ravel()
+        probabilities = np.full(board.plot_quantity, np.nan)
+
+        if not hidden.any():
+            self.components = {}
+            return probabilities.reshape(board.mines.shape)
+
+        solver.solve()
+
+        # Components still on the board, all others
+        # are dropped from the memo
+        cache = {}
+        components = [
+            self.__enumerate(component, cache)
+            for component in self.__rules()
+        ]
+        self.components = cache
+
+        # Mines and plots with nothing known about them
+        left = engine.mine_quantity - len(solver.mines)
+        interior = (
+            int(hidden.sum()) - len(solver.mines) - len(solver.safe)
+            - sum(len(plots) for plots, totals, weights in components)
+        )
+
+        # binomial(interior, left - m) for every mine count m
+        # the frontier can take, relative to the largest one
+        frontier_size = sum(len(totals) - 1 for p, totals, w in components)
+        logs = [
+            lgamma(interior + 1) - lgamma(left - m + 1)
+            - lgamma(interior - left + m + 1)
+            if 0 <= left - m <= interior else None
+            for m in range(frontier_size + 1)
+        ]
+        top = max((log for log in logs if log is not None), default=None)
+
+        if top is None:
+            raise ValueError('Mine count does not fit the board')
+
+        spread = np.array([
+            0.0 if log is None else exp(log - top) for log in logs
+        ])
+
+        # Totals of every component but one, from the
+        # products of those before and those after it
+        prefix = [np.ones(1)]
+        for plots, totals, weights in components:
+            prefix.append(np.convolve(prefix[-1], totals))
+
+        suffix = np.ones(1)
+        total = None
+
+        for k in reversed(range(len(components))):
+            plots, totals, weights = components[k]
+            others = np.convolve(prefix[k], suffix)
+
+            # Weight of this component holding m mines
+            weight = np.array([
+                others @ spread[m:m + len(others)] for m in range(len(totals))
+            ])
+
+            total = totals @ weight
+            for plot, plot_weights in zip(plots, weights):
+                probabilities[plot] = (plot_weights @ weight) / total
+
+            suffix = np.convolve(suffix, totals)
+
+        frontier = prefix[-1]
+        if total is None:
+            total = frontier @ spread[:len(frontier)]
+
+        probabilities[hidden & np.isnan(probabilities)] = (
+            frontier @ (spread[:len(frontier)]
+                        * (left - np.arange(len(frontier))))
+            / total / interior if interior else 0.0
+        )
+
+        probabilities[list(solver.mines)] = 1.0
+        probabilities[list(solver.safe)] = 0.0
+
+        return probabilities.reshape(board.mines.shape)
+
+
+    def best_guess(self):
+        """ Return the flat index of the unflagged hidden plot
+        least likely to hold a mine, or None if there is none.
+        """
+
+        probabilities = self.compute().ravel()
+        probabilities[self.solver.engine.board.flags.ravel() != 0] = np.nan
+
+        if np.isnan(probabilities).all():
+            return None
+
+        return int(np.nanargmin(probabilities))
@@ -0,0 +1,185 @@
+""" Frame profiling for PySweeper.
+
+Frame_Profiler times the phases of every frame with
+perf_counter_ns laps, keeps the recent frames for the
+on-screen overlay, and can export them as a JSON or CSV
+trace. It can also run cProfile over a window of frames.
+The main loop only calls into it while it is enabled, so
+it costs nothing when it is not.
+Like engine, this module does not need pygame.
+"""
+
+from collections import deque
+from cProfile import Profile
+from csv import DictWriter
+from json import dump
+from time import perf_counter_ns
+
+
+# Phases of a frame, in the order they run
+PHASES = (
+    'events', 'update_plots', 'update_options', 'update_time',
+    'render_plots', 'render_statbar', 'display_update'
+)
+
+
+class Frame_Profiler():
+    """ Phase timings of the last history frames. Every
+    frame is a dict of phase name to nanoseconds, plus
+    'frame' for the whole frame and counters such as
+    'blits'.
+     - timing: time frames (for the overlay and traces)
+     - trace: if not None, a list every frame is also
+       appended to, for export
+    """
+
+    def __init__(self, history=600):
+        self.timing = False
+        self.frames = deque(maxlen=history)
+        self.trace = None
+
+        # True between begin() and end()
+        self.recording = False
+        self.frame_number = 0
+        self.current = {}
+
+        self.__start = 0
+        self.__last = 0
+
+        # cProfile capture: frames first to last, into path
+        self.window = None
+        self.profile = None
+
+
+    @property
+    def enabled(self):
+        """ True if the next frame has to be profiled. """
+
+        return self.timing or self.window is not None
+
+
+    def capture(self, first, last, file_path):
+        """ Run cProfile from frame first to frame last (not
+        included), and write its stats to file_path.
+        """
+
+        self.window = (first, last, file_path)
+
+
+    def begin(self):
+        """ Start a frame. """
+
+        if self.window and self.frame_number == self.window[0]:
+            self.profile = Profile()
+            self.profile.enable()
+
+        self.current = dict.fromkeys(PHASES, 0)
+        self.current['blits'] = 0
+        self.recording = True
+
+        self.__start = self.__last = perf_counter_ns()
+
+
+    def lap(self, phase):
+        """ Add the time since the last lap to phase. """
+
+        now = perf_counter_ns()
+        self.current[phase] += now - self.__last
+        self.__last = now
+
+
+    def count(self, counter, quantity):
+        """ Add quantity to counter for this frame. """
+
+        self.current[counter] += quantity
+
+
+    def end(self):
+        """ Finish the frame started by begin(). """
+
+        self.current['frame'] = perf_counter_ns() - self.__start
+        self.recording = False
+
+        if self.timing:
+            self.frames.append(self.current)
+            if self.trace is not None:
+                self.trace.append(self.current)
+
+        self.frame_number += 1
+
+        if self.profile and self.frame_number == self.window[1]:
+            self.profile.disable()
+            self.profile.dump_stats(self.window[2])
+            self.profile = None
+            self.window = None
+
+
+    def close(self):
+        """ Write out a cProfile capture that is still
+        running, when the game ends before its last frame.
+        """
+
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.window[2])
+            self.profile = None
+
+        self.window = None
+        self.recording = False
+
+
+    def percentiles(self, key='frame', points=(50, 95, 99)):
+        """ Return the given percentiles of key over the
+        recent frames, in milliseconds.
+        """
+
+        values = sorted(frame[key] for frame in self.frames)
+
+        if not values:
+            return [0.0 for point in points]
+
+        return [
+            values[min(len(values) - 1, len(values) * point // 100)] / 1e6
+            for point in points
+        ]
+
+
+    def means(self):
+        """ Return the mean of every phase and counter over
+        the recent frames, times in milliseconds.
+        """
+
+        if not self.frames:
+            return {}
+
+        return {
+            key: sum(frame[key] for frame in self.frames) / len(self.frames)
+            / (1 if key == 'blits' else 1e6)
+            for key in self.frames[0]
+        }
+
+
+    def export(self, file_path):
+        """ Write the trace (or the recent frames if there is
+        no trace) to file_path, as CSV if its name ends in
+        .csv and JSON otherwise. Times are in microseconds.
+        """
+
+        frames = self.trace if self.trace is not None else self.frames
+        rows = [
+            {
+                key: value if key == 'blits' else value / 1000
+                for key, value in frame.items()
+            }
+            for frame in frames
+        ]
+
+        with open(file_path, 'w', newline='') as output:
+            if file_path.endswith('.csv'):
+                writer = DictWriter(
+                    output, fieldnames=('frame',) + PHASES + ('blits',)
+                )
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                dump({'unit': 'us', 'frames': rows}, output, indent=1)
@@ -0,0 +1,399 @@
+""" Replay logs for PySweeper.
+
+A replay is a fixed little-endian header, the mines of the
+board bit-packed like in a snapshot, then one record per
+action: milliseconds since the game started, the action
+kind and the flat index of the plot. Actions name plots,
+not pixels, so replays don't depend on the plot size.
+The board is stored, as the first click left it, rather
+than worked out from the seed, so that boards that took a
+search (no-guess) or the first click to deal come back
+exactly the same, however crowded.
+
+Replays play back either in real time (main.py --replay)
+or as fast as the engine goes, with `python replay.py`,
+which checks every game ends the way it was recorded and
+times it. With --frontend, the actions go through
+Terrain_Manager.update_plots as clicks, which makes a
+corpus of replays a load test for the whole input path.
+"""
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from contextlib import redirect_stdout
+from io import StringIO
+from os import replace, environ
+from time import monotonic, perf_counter
+import struct
+import sys
+
+import numpy as np
+
+from engine import Engine, Action, REVEAL, FLAG
+from topology import Topology
+
+
+MAGIC = b'PSRP'
+VERSION = 1
+
+# magic, version, terrain_side, topology radius, wrap,
+# seed, mine_quantity, win_by_reveal, and how the game
+# ended: play_state, revealed plots and marked mines
+HEADER = struct.Struct('<4sBHBBIIBBIi')
+
+Header = namedtuple('Header', [
+    'magic', 'version', 'terrain_side', 'radius', 'wrap',
+    'seed', 'mine_quantity', 'win_by_reveal',
+    'play_state', 'revealed', 'marked_mines'
+])
+
+# One action
+RECORD = np.dtype([('time', '<u4'), ('kind', 'u1'), ('index', '<u4')])
+
+Replay = namedtuple('Replay', ['header', 'mines', 'records'])
+
+
+class Recorder():
+    """ Log of the actions played on engine, from the
+    moment the Recorder is made.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.records = []
+        self.start = monotonic()
+
+
+    def record(self, action):
+        """ Add action to the log, timed now. """
+
+        self.records.append((
+            int((monotonic() - self.start) * 1000),
+            action.kind, action.index
+        ))
+
+
+    def dumps(self):
+        """ Return the replay as bytes. """
+
+        engine = self.engine
+        board = engine.board
+        topology = board.topology
+
+        header = HEADER.pack(
+            MAGIC, VERSION, board.terrain_side,
+            topology.radius, topology.wrap,
+            engine.seed, engine.mine_quantity, engine.win_by_reveal,
+            engine.play_state, int(np.count_nonzero(board.revealed)),
+            engine.marked_mines
+        )
+
+        return b''.join((
+            header,
+            np.packbits(board.mines.ravel()).tobytes(),
+            np.array(self.records, dtype=RECORD).tobytes(),
+        ))
+
+
+def read_header(data):
+    """ Return the Header at the start of data, raise
+    ValueError if data is not a replay we can read.
+    """
+
+    if len(data) < HEADER.size:
+        raise ValueError('Replay is truncated')
+
+    header = Header(*HEADER.unpack_from(data))
+
+    if header.magic != MAGIC:
+        raise ValueError('Not a PySweeper replay')
+    if header.version != VERSION:
+        raise ValueError(
+            'Unsupported replay version {}'.format(header.version)
+        )
+
+    return header
+
+
+def loads(data):
+    """ Return the Replay held in data. """
+
+    header = read_header(data)
+
+    n = header.terrain_side ** 2
+    plane = (n + 7) // 8
+    body = len(data) - HEADER.size - plane
+
+    if body < 0 or body % RECORD.itemsize:
+        raise ValueError('Replay is truncated')
+
+    mines = np.unpackbits(np.frombuffer(
+        data, dtype=np.uint8, count=plane, offset=HEADER.size
+    ))[:n]
+    records = np.frombuffer(data, dtype=RECORD, offset=HEADER.size + plane)
+
+    return Replay(header, mines, records)
+
+
+def save(file_path, recorder):
+    """ Write the replay of recorder to file_path, in one
+    step like a snapshot.
+    """
+
+    data = recorder.dumps()
+    temporary = file_path + '.tmp'
+
+    with open(temporary, 'wb') as replay:
+        replay.write(data)
+
+    replace(temporary, file_path)
+
+
+def load(file_path):
+    """ Return the Replay read from file_path. """
+
+    with open(file_path, 'rb') as replay:
+        return loads(replay.read())
+
+
+def prepare(engine, replay):
+    """ Deal the board of replay on engine, which must have
+    the same size, ready for its first action. This also
+    sets engine.win_by_reveal to the replay's, for good.
+    """
+
+    header = replay.header
+
+    if engine.terrain_side != header.terrain_side:
+        raise ValueError(
+            'Replay is for a {0}x{0} board'.format(header.terrain_side)
+        )
+
+    engine.new_game(header.seed)
+    engine.mine_quantity = header.mine_quantity
+    engine.win_by_reveal = bool(header.win_by_reveal)
+
+    # The mines are the ones left after the first click.
+    # That click must not move them again: on a crowded
+    # board its area may not have been cleared fully, and
+    # clear_area would draw from the engine's random
+    # stream in a way the recording never did
+    engine.board.place_mines(np.flatnonzero(replay.mines))
+    engine.mines_placed = True
+    engine.has_clicked = True
+    engine.recount()
+
+
+def new_engine(replay):
+    """ Return a new Engine holding the board of replay. """
+
+    header = replay.header
+
+    engine = Engine(
+        header.terrain_side,
+        Topology(header.terrain_side, header.radius, bool(header.wrap)),
+        header.seed, header.mine_quantity, defer_mines=True
+    )
+    prepare(engine, replay)
+
+    return engine
+
+
+def actions(replay):
+    """ Return the Actions of replay, in order. """
+
+    return [
+        Action(kind, index) for kind, index in zip(
+            replay.records['kind'].tolist(), replay.records['index'].tolist()
+        )
+    ]
+
+
+def outcome(engine):
+    """ Return how the game on engine stands, as the
+    (play_state, revealed, marked_mines) a replay ends on.
+    """
+
+    return (
+        engine.play_state, int(np.count_nonzero(engine.board.revealed)),
+        engine.marked_mines
+    )
+
+
+def matches(replay, engine):
+    """ True if engine ended the way replay was recorded. """
+
+    header = replay.header
+
+    return outcome(engine) == (
+        header.play_state, header.revealed, header.marked_mines
+    )
+
+
+class Playback():
+    """ Hands out the actions of replay at the pace they
+    were recorded at, see due().
+    """
+
+    def __init__(self, replay):
+        self.actions = actions(replay)
+        self.times = replay.records['time'].tolist()
+        self.position = 0
+        self.start = monotonic()
+
+
+    @property
+    def finished(self):
+        return self.position == len(self.actions)
+
+
+    def due(self):
+        """ Return the actions whose time has come since
+        the last call.
+        """
+
+        elapsed = (monotonic() - self.start) * 1000
+        first = self.position
+
+        while (
+            self.position < len(self.times)
+            and self.times[self.position] <= elapsed
+        ):
+            self.position += 1
+
+        return self.actions[first:self.position]
+
+
+def play(replay, engine):
+    """ Play the actions of replay as fast as possible on
+    engine, once prepare() dealt its board.
+    """
+
+    act = engine.act
+    for action in actions(replay):
+        act(action)
+
+
+def play_frontend(replay, terrain):
+    """ Play the actions of replay on terrain, a
+    Terrain_Manager, clicking every plot through
+    update_plots. The camera is moved to plots that are
+    out of view first. Deal the board with prepare() on
+    terrain.engine, and reset terrain.solver, beforehand.
+    """
+
+    camera = terrain.camera
+    side = terrain.terrain_side
+
+    for action in actions(replay):
+        y_offset, x_offset = divmod(action.index, side)
+
+        if not camera.is_visible(x_offset, y_offset):
+            camera.look_at(x_offset, y_offset)
+
+        x, y = camera.position(x_offset, y_offset)
+        center = (x + camera.plot_size // 2, y + camera.plot_size // 2)
+
+        terrain.update_plots(
+            action.kind == REVEAL, action.kind == FLAG, center
+        )
+
+
+def import_frontend(terrain_side):
+    """ Import obj, which takes its settings from const,
+    to draw in a hidden window. Give const the board size
+    of the replays.
+    """
+
+    # Must be set before pygame is imported
+    environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+    argv = sys.argv
+    sys.argv = [argv[0], '--size', str(terrain_side)]
+
+    try:
+        import obj
+    finally:
+        sys.argv = argv
+
+    return obj
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        description="Play PySweeper replays back as fast as possible, "
+        "check their outcome and time them"
+    )
+    parser.add_argument('replays', nargs='+', help="replay files")
+    parser.add_argument(
+        '--frontend', action='store_true',
+        help="click through Terrain_Manager.update_plots, "
+        "in a hidden window, instead of calling the engine"
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help="times to play every replay (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    replays = []
+    for file_path in args.replays:
+        try:
+            replays.append((file_path, load(file_path)))
+        except (OSError, ValueError) as error:
+            print("Could not load {}: {}".format(file_path, error))
+            return 1
+
+    terrains = {}
+    if args.frontend:
+        obj = import_frontend(replays[0][1].header.terrain_side)
+
+    failed = 0
+    moves = 0
+    elapsed = 0.0
+
+    for file_path, replay in replays:
+        for attempt in range(args.repeat):
+            if args.frontend:
+                header = replay.header
+                key = (header.terrain_side, header.radius, header.wrap)
+                if key not in terrains:
+                    terrains[key] = obj.Terrain_Manager(
+                        header.terrain_side, Topology(
+                            header.terrain_side, header.radius,
+                            bool(header.wrap)
+                        )
+                    )
+                terrain = terrains[key]
+                engine = terrain.engine
+                prepare(engine, replay)
+                terrain.solver.reset()
+                start = perf_counter()
+                # Without the messages printed for every game
+                with redirect_stdout(StringIO()):
+                    play_frontend(replay, terrain)
+            else:
+                engine = new_engine(replay)
+                start = perf_counter()
+                play(replay, engine)
+
+            elapsed += perf_counter() - start
+            moves += len(replay.records)
+
+        if not matches(replay, engine):
+            failed += 1
+            print("{}: ended differently than recorded".format(file_path))
+
+    print(
+        "{} replays, {} moves in {:.3f} s, {:.1f} us per move, "
+        "{} mismatched".format(
+            len(replays) * args.repeat, moves, elapsed,
+            elapsed / max(moves, 1) * 1e6, failed
+        )
+    )
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,782 @@
+""" Game server for PySweeper.
+
+Hosts many games at once over TCP, on one asyncio event
+loop. Games are Engines owned by the server, clients join
+them to play or only to watch. A client gets a snapshot
+of the board when it joins, and after that only deltas:
+the plots whose tile changed with each action, encoded
+once and sent as the same bytes to everyone in the game.
+
+Every client has a bounded queue of outgoing messages. A
+client that falls behind by more than the queue holds
+has its queued deltas dropped and gets a fresh snapshot
+instead, so one slow client never holds up a game or
+makes the server buffer without end.
+
+USAGE:
+ - `python server.py --port 8765`
+ - `python server.py --load-test --games 200 --spectators 2000`
+   hosts games on localhost, plays them from in-process
+   clients and checks every client ends up with the board
+   the server has. Some spectators stop reading while the
+   games are played, and must be resynced
+ - `python server.py --help` for the other options
+
+PROTOCOL:
+Every message is a little-endian u32 length followed by
+that many bytes, the first of which is the message type.
+From clients:
+ - JOIN: game_id, terrain_side and mine_quantity of the
+   game to create if it doesn't exist yet (0 for the
+   default), and 1 to play or 0 to watch
+ - ACT: an action kind and a flat plot index, as in engine
+ - RESTART: deal a new board in the game
+From the server:
+ - SNAPSHOT: game_id and sequence, then a snapshot of the
+   game (see snapshot.py) with its mine plane left empty
+ - DELTA: sequence, play_state, marked_mines and a count,
+   then count (index u32, tile u8) cells
+ - ERROR: a UTF-8 message
+sequence goes up with every change to a game. A client
+skips deltas not newer than its last snapshot.
+"""
+
+from argparse import ArgumentParser
+from contextlib import suppress
+from random import Random
+from time import monotonic, perf_counter
+import asyncio
+import socket
+import struct
+import sys
+
+import numpy as np
+
+from board import HIDDEN
+from engine import Engine, Action, REVEAL, FLAG, PLAYING
+import snapshot
+
+
+PORT = 8765
+
+# Same limits as const, which needs pygame
+MIN_SIDE = 9
+MAX_SIDE = 1000
+
+# Messages a client may fall behind by before it is resynced
+QUEUE_SIZE = 64
+
+# Bytes waiting in a socket before a client is treated as
+# slow, and messages to it are queued
+WRITE_BUFFER = 1 << 16
+
+# Kernel send buffer of every client socket. Left to grow
+# on its own, it takes megabytes per client, and hides
+# slow clients from the queue
+SEND_BUFFER = 1 << 16
+
+# Longest message a client may send, and the server
+MAX_CLIENT_MESSAGE = 64
+MAX_SERVER_MESSAGE = 1 << 24
+
+# Slow spectators in the load test watch a game of this
+# side, whose snapshot alone outgrows the socket buffers,
+# with a receive buffer of SLOW_BUFFER bytes
+SLOW_SIDE = MAX_SIDE
+SLOW_BUFFER = 4096
+
+# Message types
+JOIN_TYPE = 1
+ACT_TYPE = 2
+RESTART_TYPE = 3
+SNAPSHOT_TYPE = 16
+DELTA_TYPE = 17
+ERROR_TYPE = 18
+
+FRAME = struct.Struct('<I')
+
+# type, game_id, terrain_side, mine_quantity, player
+JOIN = struct.Struct('<BIHIB')
+# type, action kind, index
+ACT = struct.Struct('<BBI')
+RESTART = struct.Struct('<B')
+# type, game_id, sequence, followed by the snapshot
+SNAPSHOT = struct.Struct('<BII')
+# type, sequence, play_state, marked_mines, count,
+# followed by count cells
+DELTA = struct.Struct('<BIBiI')
+
+# One changed plot in a delta
+CELL = np.dtype([('index', '<u4'), ('tile', 'u1')])
+
+
+def frame(message):
+    """ Return message with its length in front. """
+
+    return FRAME.pack(len(message)) + message
+
+
+async def read_frame(reader, limit):
+    """ Return the next message from reader. Raise
+    ValueError if it is longer than limit.
+    """
+
+    length, = FRAME.unpack(await reader.readexactly(FRAME.size))
+
+    if length > limit:
+        raise ValueError('Message of {} bytes is too long'.format(length))
+
+    return await reader.readexactly(length)
+
+
+def join_message(game_id, terrain_side, mine_quantity=0, player=True):
+    return JOIN.pack(JOIN_TYPE, game_id, terrain_side, mine_quantity, player)
+
+
+def act_message(action):
+    return ACT.pack(ACT_TYPE, action.kind, action.index)
+
+
+def restart_message():
+    return RESTART.pack(RESTART_TYPE)
+
+
+def error_message(text):
+    return frame(bytes((ERROR_TYPE,)) + text.encode('utf-8'))
+
+
+class Game():
+    """ A game hosted by the server, and the Connections
+    joined to it. sequence counts the changes made to the
+    board so far.
+    """
+
+    def __init__(self, game_id, terrain_side, mine_quantity=None):
+        self.game_id = game_id
+        self.engine = Engine(terrain_side, mine_quantity=mine_quantity)
+        self.engine.board.changed.clear()
+
+        self.clients = set()
+        self.sequence = 0
+        self.start = monotonic()
+
+        # (sequence, message) of the last snapshot made
+        self.__snapshot = None
+
+
+    def snapshot(self):
+        """ Return the SNAPSHOT message of the game as it
+        stands. It is made once per change, however many
+        clients need it.
+        """
+
+        if self.__snapshot is None or self.__snapshot[0] != self.sequence:
+            timer = (monotonic() - self.start) * 1000
+            message = frame(
+                SNAPSHOT.pack(SNAPSHOT_TYPE, self.game_id, self.sequence)
+                + snapshot.dumps(self.engine, timer, hide_mines=True)
+            )
+            self.__snapshot = (self.sequence, message)
+
+        return self.__snapshot[1]
+
+
+    def act(self, action):
+        """ Apply action and send what it changed. """
+
+        self.engine.act(action)
+        self.send_changes()
+
+
+    def send_changes(self):
+        """ Send every client a DELTA of the plots changed
+        since the last one, if any did.
+        """
+
+        engine = self.engine
+        changed = engine.board.changed
+
+        if not changed:
+            return
+
+        indices = np.fromiter(changed, dtype=np.uint32, count=len(changed))
+        indices.sort()
+        changed.clear()
+
+        cells = np.empty(indices.size, dtype=CELL)
+        cells['index'] = indices
+        cells['tile'] = engine.board.tiles.ravel()[indices]
+
+        self.sequence += 1
+        message = frame(DELTA.pack(
+            DELTA_TYPE, self.sequence, engine.play_state,
+            engine.marked_mines, cells.size
+        ) + cells.tobytes())
+
+        for client in self.clients:
+            client.send(self.sequence, message)
+
+
+    def restart(self):
+        """ Deal a new board, and send it to every client. """
+
+        self.engine.new_game()
+        self.engine.board.changed.clear()
+
+        self.sequence += 1
+        self.start = monotonic()
+
+        for client in self.clients:
+            client.resync()
+
+
+class Connection():
+    """ Server side of one client. Messages to it are written
+    straight away while it keeps up, and otherwise go through
+    a queue of queue_size, emptied by write_loop() as fast
+    as the client reads them.
+     - game: the Game joined, or None
+     - player: True if the client may act on its game
+     - synced: sequence of the last snapshot sent
+     - overflows: times the client fell too far behind
+    """
+
+    def __init__(self, writer, queue_size=QUEUE_SIZE):
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+
+        connection = writer.get_extra_info('socket')
+        if connection is not None:
+            connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER
+            )
+
+        self.game = None
+        self.player = False
+        self.synced = 0
+        self.overflows = 0
+
+
+    def send(self, sequence, message):
+        """ Queue message, which brings the board to sequence
+        (or None if it isn't about the board).
+        """
+
+        transport = self.writer.transport
+
+        # Nothing is waiting, so this can't overtake anything
+        if (
+            self.queue.empty() and not transport.is_closing()
+            and transport.get_write_buffer_size() < WRITE_BUFFER
+        ):
+            transport.write(message)
+            return
+
+        try:
+            self.queue.put_nowait((sequence, message))
+        except asyncio.QueueFull:
+            self.overflows += 1
+            self.resync()
+
+
+    def resync(self):
+        """ Drop everything queued, and send a snapshot of
+        the game in its place.
+        """
+
+        queue = self.queue
+
+        while not queue.empty():
+            queue.get_nowait()
+
+        # A snapshot is made when its turn comes,
+        # of the board as it is then
+        queue.put_nowait((None, None))
+
+
+    async def write_loop(self):
+        """ Write out queued messages until the
+        client goes away.
+        """
+
+        writer = self.writer
+
+        with suppress(ConnectionError):
+            while True:
+                sequence, message = await self.queue.get()
+
+                if message is None:
+                    if self.game is None:
+                        continue
+                    self.synced = self.game.sequence
+                    message = self.game.snapshot()
+
+                elif sequence is not None and sequence <= self.synced:
+                    # Already in the snapshot sent
+                    continue
+
+                writer.write(message)
+                await writer.drain()
+
+
+class Game_Server():
+    """ Hosts games, by game_id, for as long as a client is
+    joined to them. queue_size is passed to every
+    Connection.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.games = {}
+        self.connections = set()
+
+
+    async def handle(self, reader, writer):
+        """ Serve one client, until it disconnects. """
+
+        connection = Connection(writer, self.queue_size)
+        self.connections.add(connection)
+        sender = asyncio.create_task(connection.write_loop())
+
+        try:
+            while not sender.done():
+                message = await read_frame(reader, MAX_CLIENT_MESSAGE)
+                self.dispatch(connection, message)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.leave(connection)
+            self.connections.discard(connection)
+            sender.cancel()
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+
+    def dispatch(self, connection, message):
+        """ Carry out a message from connection, or send
+        it an ERROR if it can't be.
+        """
+
+        try:
+            kind = message[0]
+
+            if kind == JOIN_TYPE:
+                self.join(connection, *JOIN.unpack(message)[1:])
+            elif kind == ACT_TYPE:
+                self.act(connection, Action(*ACT.unpack(message)[1:]))
+            elif kind == RESTART_TYPE:
+                self.game_of(connection).restart()
+            else:
+                raise ValueError('Unknown message type {}'.format(kind))
+
+        except (IndexError, struct.error, ValueError) as error:
+            connection.send(None, error_message(str(error) or 'Bad message'))
+
+
+    def join(self, connection, game_id, terrain_side, mine_quantity, player):
+        """ Move connection to the game game_id, which
+        is created if it doesn't exist yet.
+        """
+
+        self.leave(connection)
+
+        game = self.games.get(game_id)
+
+        if game is None:
+            if not MIN_SIDE <= terrain_side <= MAX_SIDE:
+                raise ValueError('Boards are {} to {} plots a side'.format(
+                    MIN_SIDE, MAX_SIDE
+                ))
+
+            game = Game(game_id, terrain_side, mine_quantity or None)
+            self.games[game_id] = game
+
+        game.clients.add(connection)
+        connection.game = game
+        connection.player = bool(player)
+        connection.resync()
+
+
+    def leave(self, connection):
+        """ Take connection out of its game. The game ends
+        with its last client.
+        """
+
+        game = connection.game
+
+        if game is None:
+            return
+
+        game.clients.discard(connection)
+        connection.game = None
+
+        if not game.clients:
+            del self.games[game.game_id]
+
+
+    def game_of(self, connection):
+        """ Return the game connection plays in. """
+
+        if connection.game is None or not connection.player:
+            raise ValueError('Only players of a game can change it')
+
+        return connection.game
+
+
+    def act(self, connection, action):
+        """ Play action in the game of connection. """
+
+        game = self.game_of(connection)
+
+        if (
+            action.kind not in (REVEAL, FLAG)
+            or not 0 <= action.index < game.engine.plot_quantity
+        ):
+            raise ValueError('Invalid action {}'.format(tuple(action)))
+
+        game.act(action)
+
+
+    async def serve(self, host='127.0.0.1', port=PORT):
+        """ Start listening, return the asyncio Server. """
+
+        return await asyncio.start_server(self.handle, host, port)
+
+
+class Remote_Game():
+    """ A game as a client sees it, kept up to date with
+    apply(). tiles holds the tile id of every plot, flat.
+    """
+
+    def __init__(self):
+        self.game_id = None
+        self.sequence = 0
+        self.terrain_side = 0
+        self.tiles = None
+        self.play_state = PLAYING
+        self.marked_mines = 0
+        self.error = None
+
+
+    def apply(self, message):
+        """ Update the game from a server message. Return
+        the message type.
+        """
+
+        kind = message[0]
+
+        if kind == SNAPSHOT_TYPE:
+            _, self.game_id, self.sequence = SNAPSHOT.unpack_from(message)
+            header, tiles = snapshot.read_tiles(message[SNAPSHOT.size:])
+
+            self.terrain_side = header.terrain_side
+            self.tiles = tiles
+            self.play_state = header.play_state
+            self.marked_mines = header.marked_mines
+
+        elif kind == DELTA_TYPE:
+            _, sequence, play_state, marked_mines, count = (
+                DELTA.unpack_from(message)
+            )
+
+            # Deltas from before the last snapshot are in it
+            if sequence > self.sequence:
+                cells = np.frombuffer(
+                    message, dtype=CELL, count=count, offset=DELTA.size
+                )
+                self.tiles[cells['index']] = cells['tile']
+
+                self.sequence = sequence
+                self.play_state = play_state
+                self.marked_mines = marked_mines
+
+        elif kind == ERROR_TYPE:
+            self.error = message[1:].decode('utf-8')
+
+        return kind
+
+
+class Client():
+    """ Client connection to a Game_Server, with the
+    Remote_Game it has joined.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.game = Remote_Game()
+
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=PORT, receive_buffer=None):
+        """ Connect to the server at host, port. receive_buffer
+        sets the socket's receive buffer, in bytes, small ones
+        making for a client on a slow link.
+        """
+
+        if receive_buffer is None:
+            return cls(*await asyncio.open_connection(host, port))
+
+        # The buffer must be set before connecting to count
+        connection = socket.socket()
+        connection.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer
+        )
+        connection.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(
+            connection, (host, port)
+        )
+
+        return cls(*await asyncio.open_connection(sock=connection))
+
+
+    def send(self, message):
+        self.writer.write(frame(message))
+
+
+    async def receive(self):
+        """ Wait for the next server message, apply it to
+        the game and return its type.
+        """
+
+        return self.game.apply(
+            await read_frame(self.reader, MAX_SERVER_MESSAGE)
+        )
+
+
+    async def close(self):
+        self.writer.close()
+        with suppress(ConnectionError):
+            await self.writer.wait_closed()
+
+
+async def play_random(client, moves, rng, reveals=0.9):
+    """ Play moves random actions on the hidden plots of the
+    game client has joined, waiting for the result of every
+    one, reveals being the share of them that are reveals
+    rather than flags. Lost and won games are restarted.
+    """
+
+    game = client.game
+
+    while game.tiles is None:
+        await client.receive()
+
+    for move in range(moves):
+        sequence = game.sequence
+        hidden = np.flatnonzero(game.tiles == HIDDEN)
+
+        if game.play_state != PLAYING or not hidden.size:
+            client.send(restart_message())
+        else:
+            kind = REVEAL if rng.random() < reveals else FLAG
+            client.send(act_message(Action(kind, int(rng.choice(hidden)))))
+
+        # Acting on a hidden plot always changes it
+        while game.sequence == sequence:
+            await client.receive()
+
+
+async def watch(client):
+    """ Apply server messages to the game of client,
+    until the connection closes.
+    """
+
+    with suppress(asyncio.IncompleteReadError, ConnectionError):
+        while True:
+            await client.receive()
+
+
+async def load_test(
+    games, spectators, moves, terrain_side, queue_size, slow=0
+):
+    """ Host games on localhost, play each from one client
+    while spectators watch, then check that every client has
+    the board the server has.
+    With slow, that many more spectators watch one more game,
+    of SLOW_SIDE, and read nothing until every game is
+    played. That game is only flagged, so it never restarts,
+    and is played long enough to overflow their queues.
+    Return the number of clients that don't have the board
+    in the end, plus the slow ones that were never resynced.
+    """
+
+    server = Game_Server(queue_size)
+    listener = await server.serve(port=0)
+    port = listener.sockets[0].getsockname()[1]
+
+    players = []
+    watchers = []
+
+    for game_id in range(games):
+        client = await Client.connect(port=port)
+        client.send(join_message(game_id, terrain_side))
+        players.append(client)
+
+    for number in range(spectators):
+        client = await Client.connect(port=port)
+        client.send(join_message(number % games, terrain_side, player=False))
+        watchers.append(client)
+
+    watching = [asyncio.create_task(watch(client)) for client in watchers]
+
+    plays = [
+        play_random(client, moves, Random(number))
+        for number, client in enumerate(players)
+    ]
+    slow_watchers = []
+
+    if slow:
+        client = await Client.connect(port=port)
+        client.send(join_message(games, SLOW_SIDE))
+        players.append(client)
+        plays.append(play_random(client, 4 * queue_size, Random(games), 0))
+
+        for number in range(slow):
+            client = await Client.connect(
+                port=port, receive_buffer=SLOW_BUFFER
+            )
+            client.send(join_message(games, SLOW_SIDE, player=False))
+            slow_watchers.append(client)
+
+    start = perf_counter()
+    await asyncio.gather(*plays)
+    elapsed = perf_counter() - start
+
+    # Slow spectators read at last
+    watching.extend(
+        asyncio.create_task(watch(client)) for client in slow_watchers
+    )
+    watchers.extend(slow_watchers)
+
+    def synced(client):
+        game = server.games.get(client.game.game_id)
+        return game is not None and client.game.sequence == game.sequence
+
+    # Let spectators catch up with the last moves
+    for attempt in range(500):
+        if all(synced(client) for client in watchers):
+            break
+        await asyncio.sleep(0.01)
+
+    failed = 0
+
+    for client in players + watchers:
+        game = server.games.get(client.game.game_id)
+        if game is None or client.game.tiles is None or not np.array_equal(
+            client.game.tiles, game.engine.board.tiles.ravel()
+        ):
+            failed += 1
+
+    overflows = sum(
+        connection.overflows for connection in server.connections
+    )
+
+    if slow:
+        # Every slow spectator must have fallen behind
+        never_resynced = sum(
+            not connection.overflows
+            for connection in server.games[games].clients
+            if not connection.player
+        )
+        failed += never_resynced
+    else:
+        never_resynced = 0
+
+    print(
+        "{} games, {} spectators: {} moves in {:.3f} s, {:.0f} moves/s, "
+        "{} resyncs, {} clients out of sync".format(
+            games, spectators, games * moves, elapsed,
+            games * moves / elapsed, overflows, failed - never_resynced
+        )
+    )
+
+    if slow:
+        print("{} slow spectators, {} never resynced".format(
+            slow, never_resynced
+        ))
+
+    for task in watching:
+        task.cancel()
+    for client in players + watchers:
+        await client.close()
+
+    # Let the server see every client go
+    while server.connections:
+        await asyncio.sleep(0.01)
+
+    listener.close()
+    await listener.wait_closed()
+
+    return failed
+
+
+async def run(host, port, queue_size):
+    server = Game_Server(queue_size)
+    listener = await server.serve(host, port)
+
+    print("Serving PySweeper games on {}:{}".format(host, port))
+
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Host PySweeper games over TCP")
+    parser.add_argument(
+        '--host', default='127.0.0.1',
+        help="address to listen on (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--port', type=int, default=PORT,
+        help="port to listen on (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--queue-size', type=int, default=QUEUE_SIZE,
+        help="messages a client may fall behind by before it gets "
+        "a fresh snapshot instead (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--load-test', action='store_true',
+        help="play games from local clients and check their boards, "
+        "instead of serving"
+    )
+    parser.add_argument(
+        '--games', type=int, default=100,
+        help="games to play in the load test (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--spectators', type=int, default=1000,
+        help="clients watching in the load test (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--moves', type=int, default=50,
+        help="moves per game in the load test (default: %(default)s)"
+    )
+    parser.add_argument(
+        '-s', '--size', type=int, default=16,
+        help="board side in the load test (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--slow', type=int, default=10,
+        help="spectators in the load test that stop reading, on a "
+        "game of their own (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        failed = asyncio.run(load_test(
+            args.games, args.spectators, args.moves, args.size,
+            args.queue_size, args.slow
+        ))
+        return 1 if failed else 0
+
+    with suppress(KeyboardInterrupt):
+        asyncio.run(run(args.host, args.port, args.queue_size))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
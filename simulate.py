@@ -0,0 +1,331 @@
+""" Batch game simulator for PySweeper.
+
+Plays many seeded games headless, straight on the Engine,
+spread over a pool of worker processes. A policy decides
+every move, the per-game results are merged into one
+summary along with the games per second achieved.
+
+USAGE:
+ - `python simulate.py --games 1000 --size 16`
+ - `python simulate.py --help` for the other options
+
+A policy is a function policy(engine, rng) called once per
+game. It returns a function next_action(result) that gets
+the Result of the previous move (None before the first
+one) and returns the next Action, or None to give up.
+Policies are looked up by name in POLICIES, or imported
+from 'module:function'.
+"""
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from os import cpu_count
+from random import Random
+from time import perf_counter
+
+import numpy as np
+
+from engine import Engine, Action, REVEAL, FLAG, PLAYING, WON
+from solver import Solver
+from probability import Probability_Map
+from generate import No_Guess_Layout
+
+
+# Outcome of one game
+Game_Result = namedtuple('Game_Result', [
+    'seed', 'won', 'moves', 'revealed', 'seconds'
+])
+
+# Board options shared by every game of a batch
+Batch = namedtuple('Batch', [
+    'terrain_side', 'mine_quantity', 'defer_mines', 'policy', 'max_moves',
+    'no_guess'
+])
+
+
+def random_policy(engine, rng):
+    """ Reveal random hidden plots. Once only mines can be
+    left hidden, flag them one by one to win.
+    """
+
+    board = engine.board
+
+    def next_action(result):
+        hidden = np.flatnonzero(
+            ~board.revealed.ravel() & (board.flags.ravel() == 0)
+        )
+
+        if not hidden.size:
+            return None
+
+        kind = (
+            FLAG if hidden.size + engine.marked_mines == engine.mine_quantity
+            else REVEAL
+        )
+
+        return Action(kind, int(hidden[rng.randrange(hidden.size)]))
+
+    return next_action
+
+
+def solver_policy(engine, rng):
+    """ Play what the Solver deduces, and reveal a random
+    plot that is not a known mine when it is stuck.
+    """
+
+    board = engine.board
+    solver = Solver(engine)
+
+    def next_action(result):
+        if result is not None:
+            solver.update(result)
+
+        action = solver.hint()
+        if action is not None:
+            return action
+
+        hidden = np.flatnonzero(
+            ~board.revealed.ravel() & (board.flags.ravel() == 0)
+        ).tolist()
+        hidden = [plot for plot in hidden if plot not in solver.mines]
+
+        if not hidden:
+            return None
+
+        return Action(REVEAL, hidden[rng.randrange(len(hidden))])
+
+    return next_action
+
+
+def probability_policy(engine, rng):
+    """ Play what the Solver deduces, and reveal the plot
+    least likely to hold a mine when it is stuck.
+    """
+
+    solver = Solver(engine)
+    odds = Probability_Map(solver)
+
+    def next_action(result):
+        if result is not None:
+            solver.update(result)
+
+        action = solver.hint()
+        if action is not None:
+            return action
+
+        plot = odds.best_guess()
+        return None if plot is None else Action(REVEAL, plot)
+
+    return next_action
+
+
+POLICIES = {
+    'random': random_policy,
+    'solver': solver_policy,
+    'probability': probability_policy,
+}
+
+
+def get_policy(name):
+    """ Return the policy called name in POLICIES,
+    or imported from 'module:function'.
+    """
+
+    if name in POLICIES:
+        return POLICIES[name]
+
+    module, _, function = name.partition(':')
+
+    if not function:
+        raise ValueError('Unknown policy: {}'.format(name))
+
+    return getattr(import_module(module), function)
+
+
+def play_games(batch, seeds):
+    """ Play one game per seed in seeds, and return
+    the list of their Game_Result. This is what
+    every worker process runs.
+    """
+
+    policy = get_policy(batch.policy)
+
+    # One engine per worker, its topology is reused.
+    # Workers already fill every core, so no-guess
+    # candidates are checked in the worker itself
+    engine = Engine(
+        batch.terrain_side, seed=seeds[0],
+        mine_quantity=batch.mine_quantity,
+        defer_mines=batch.defer_mines or batch.no_guess,
+        mine_layout=No_Guess_Layout(workers=1) if batch.no_guess else None
+    )
+
+    results = []
+
+    for seed in seeds:
+        engine.new_game(seed)
+
+        # Policies get their own stream, so that they
+        # don't change the engine's random draws
+        next_action = policy(engine, Random(seed))
+        result = None
+        moves = 0
+        # Plots the player uncovered, not counting
+        # what the end of the game shows
+        revealed = 0
+
+        start = perf_counter()
+
+        while engine.play_state == PLAYING and moves < batch.max_moves:
+            action = next_action(result)
+            if action is None:
+                break
+            result = engine.act(action)
+            moves += 1
+
+            if action.kind == REVEAL and engine.play_state == PLAYING:
+                revealed += len(result.tiles)
+
+        seconds = perf_counter() - start
+
+        if engine.play_state == WON:
+            revealed = engine.plot_quantity - engine.mine_quantity
+
+        results.append(Game_Result(
+            seed, engine.play_state == WON, moves, revealed, seconds
+        ))
+
+    return results
+
+
+def simulate(
+    games, terrain_side, policy='random', workers=None, seed=0,
+    mine_quantity=None, defer_mines=False, max_moves=None, no_guess=False
+):
+    """ Play games seeded games, with seeds seed, seed + 1...
+    over workers processes (one per core by default).
+    Return the list of Game_Result, in seed order, and the
+    wall time it took.
+    """
+
+    workers = workers or cpu_count() or 1
+
+    batch = Batch(
+        terrain_side, mine_quantity, defer_mines, policy,
+        # Every move changes at least one plot
+        max_moves or 2 * terrain_side ** 2, no_guess
+    )
+
+    # Fail now rather than in every worker
+    get_policy(policy)
+
+    seeds = [(seed + game) % 2 ** 32 for game in range(games)]
+
+    # A few chunks per worker balance the load,
+    # without paying for one task per game
+    chunk = max(1, -(-games // (workers * 4)))
+    chunks = [seeds[i:i + chunk] for i in range(0, games, chunk)]
+
+    start = perf_counter()
+
+    if workers == 1:
+        merged = [play_games(batch, seeds) for seeds in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            merged = list(pool.map(play_games, [batch] * len(chunks), chunks))
+
+    elapsed = perf_counter() - start
+
+    return [result for results in merged for result in results], elapsed
+
+
+def summarize(results, elapsed):
+    """ Merge per-game results into a dict of totals and
+    averages. elapsed is the wall time of the batch.
+    """
+
+    games = len(results)
+    moves = sum(result.moves for result in results)
+    wins = sum(result.won for result in results)
+
+    return {
+        'games': games,
+        'wins': wins,
+        'win_rate': wins / games if games else 0.0,
+        'moves': moves,
+        'mean_moves': moves / games if games else 0.0,
+        'mean_revealed': (
+            sum(result.revealed for result in results) / games
+            if games else 0.0
+        ),
+        'seconds_per_move': (
+            sum(result.seconds for result in results) / moves
+            if moves else 0.0
+        ),
+        'elapsed': elapsed,
+        'games_per_second': games / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        description="Play PySweeper games in batch and report statistics"
+    )
+    parser.add_argument(
+        '-n', '--games', type=int, default=1000,
+        help="number of games to play (default: %(default)s)"
+    )
+    parser.add_argument(
+        '-s', '--size', type=int, default=16,
+        help="number of plots along one side (default: %(default)s)"
+    )
+    parser.add_argument(
+        '-m', '--mines', type=int,
+        help="number of mines, by default a seventh to a fifth "
+        "of the plots"
+    )
+    parser.add_argument(
+        '-p', '--policy', default='random',
+        help="policy name ({}) or module:function "
+        "(default: %(default)s)".format(', '.join(sorted(POLICIES)))
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int,
+        help="number of worker processes (default: one per core)"
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="seed of the first game (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--defer-mines', action='store_true',
+        help="place mines on the first click"
+    )
+    parser.add_argument(
+        '--no-guess', action='store_true',
+        help="only play boards that can be cleared without guessing"
+    )
+    args = parser.parse_args(argv)
+
+    results, elapsed = simulate(
+        args.games, args.size, args.policy, args.workers, args.seed,
+        args.mines, args.defer_mines, no_guess=args.no_guess
+    )
+    summary = summarize(results, elapsed)
+
+    print(
+        "{games} games, {wins} won ({win_rate:.1%}), "
+        "{mean_moves:.1f} moves and {mean_revealed:.1f} plots "
+        "revealed per game".format(**summary)
+    )
+    print(
+        "{:.1f} us per move, {:.0f} games per second".format(
+            summary['seconds_per_move'] * 1e6, summary['games_per_second']
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+""" Binary snapshots of PySweeper games.
+
+A snapshot is a fixed little-endian header followed by
+the board, bit-packed:
+ - mines: 1 bit per plot
+ - flags: 2 bit planes per plot (flagged, unknown)
+ - tiles: the tile id shown, 4 bits per plot
+Revealed plots are the ones not showing HIDDEN, FLAGGED
+or UNKNOWN. The whole body is read back with one
+np.frombuffer call, without building anything per plot.
+Like engine, this module does not need pygame.
+"""
+
+from collections import namedtuple
+from os import replace
+import struct
+
+import numpy as np
+
+from board import HIDDEN, FLAGGED, UNKNOWN
+from engine import Engine
+from topology import Topology
+
+
+MAGIC = b'PSWP'
+VERSION = 2
+
+# magic, version, terrain_side, topology radius, wrap,
+# seed, mine_quantity, marked_mines, play_state,
+# has_clicked, timer in milliseconds
+HEADER = struct.Struct('<4sBHBBIIiBBI')
+
+Header = namedtuple('Header', [
+    'magic', 'version', 'terrain_side', 'radius', 'wrap',
+    'seed', 'mine_quantity', 'marked_mines', 'play_state', 'has_clicked',
+    'timer'
+])
+
+
+def _sizes(plot_quantity):
+    """ Return the byte length of one bit plane and
+    of the tile nibbles for plot_quantity plots.
+    """
+
+    return (plot_quantity + 7) // 8, (plot_quantity + 1) // 2
+
+
+def dumps(engine, timer=0, hide_mines=False):
+    """ Return the snapshot of engine as bytes. timer is
+    the time played so far, in milliseconds. With
+    hide_mines, the mine plane and the seed are left
+    empty, for players who must only see what is on screen.
+    """
+
+    board = engine.board
+    topology = board.topology
+    n = board.plot_quantity
+
+    header = HEADER.pack(
+        MAGIC, VERSION, board.terrain_side,
+        topology.radius, topology.wrap,
+        0 if hide_mines else engine.seed,
+        engine.mine_quantity, engine.marked_mines,
+        engine.play_state, engine.has_clicked,
+        int(timer)
+    )
+
+    flags = board.flags.ravel()
+
+    # Two tiles per byte, high nibble first
+    tiles = np.zeros(_sizes(n)[1] * 2, dtype=np.uint8)
+    tiles[:n] = board.tiles.ravel()
+
+    if hide_mines:
+        mines = bytes(_sizes(n)[0])
+    else:
+        mines = np.packbits(board.mines.ravel()).tobytes()
+
+    return b''.join((
+        header,
+        mines,
+        np.packbits(flags & 1).tobytes(),
+        np.packbits(flags >> 1).tobytes(),
+        ((tiles[0::2] << 4) | tiles[1::2]).tobytes(),
+    ))
+
+
+def read_header(data):
+    """ Return the Header at the start of data, raise
+    ValueError if data is not a snapshot we can read.
+    """
+
+    if len(data) < HEADER.size:
+        raise ValueError('Snapshot is truncated')
+
+    header = Header(*HEADER.unpack_from(data))
+
+    if header.magic != MAGIC:
+        raise ValueError('Not a PySweeper snapshot')
+    if header.version != VERSION:
+        raise ValueError(
+            'Unsupported snapshot version {}'.format(header.version)
+        )
+
+    return header
+
+
+def read_tiles(data):
+    """ Return the Header of the snapshot in data and the
+    tile id every plot shows, flat, without building an
+    Engine.
+    """
+
+    header = read_header(data)
+    n = header.terrain_side ** 2
+    plane, nibbles = _sizes(n)
+
+    if len(data) != HEADER.size + 3 * plane + nibbles:
+        raise ValueError('Snapshot is truncated')
+
+    tiles = np.frombuffer(
+        data, dtype=np.uint8, offset=HEADER.size + 3 * plane
+    )
+
+    return header, np.stack((tiles >> 4, tiles & 15), axis=1).ravel()[:n]
+
+
+def restore(engine, data):
+    """ Overwrite the game in engine with the snapshot in
+    data. engine must have the same board size and
+    topology. Return the timer stored in the snapshot.
+    """
+
+    header, tiles = read_tiles(data)
+    board = engine.board
+    topology = board.topology
+    n = board.plot_quantity
+
+    if header.terrain_side != board.terrain_side:
+        raise ValueError(
+            'Snapshot is for a {0}x{0} board'.format(header.terrain_side)
+        )
+    if (header.radius, bool(header.wrap)) != (
+        topology.radius, bool(topology.wrap)
+    ):
+        raise ValueError(
+            'Snapshot is for a {} board of radius {}'.format(
+                'wrapping' if header.wrap else 'flat', header.radius
+            )
+        )
+
+    plane = _sizes(n)[0]
+    body = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size)
+
+    def bits(section):
+        return np.unpackbits(body[section * plane:(section + 1) * plane])[:n]
+
+    board.mines.ravel()[:] = bits(0)
+    board.flags.ravel()[:] = bits(1) | (bits(2) << 1)
+    board.tiles.ravel()[:] = tiles
+    board.revealed.ravel()[:] = ~np.isin(tiles, (HIDDEN, FLAGGED, UNKNOWN))
+    board.update_adjacent()
+
+    # Whoever shows the board redraws all of it after a load
+    board.changed.clear()
+
+    engine.seed = header.seed
+    engine.mine_quantity = header.mine_quantity
+    engine.marked_mines = header.marked_mines
+    engine.play_state = header.play_state
+    engine.has_clicked = bool(header.has_clicked)
+    # A game saved before its first click may still be
+    # waiting to place its mines
+    engine.mines_placed = engine.has_clicked or bool(board.mines.any())
+    engine.recount()
+
+    return header.timer
+
+
+def loads(data):
+    """ Return a new Engine holding the snapshot in data,
+    and the timer stored with it.
+    """
+
+    header = read_header(data)
+
+    engine = Engine(
+        header.terrain_side,
+        Topology(header.terrain_side, header.radius, bool(header.wrap))
+    )
+
+    return engine, restore(engine, data)
+
+
+def save(file_path, engine, timer=0):
+    """ Write the snapshot of engine to file_path. The file
+    is replaced in one step, so that a crash while saving
+    never leaves half a snapshot behind.
+    """
+
+    temporary = file_path + '.tmp'
+
+    with open(temporary, 'wb') as snapshot:
+        snapshot.write(dumps(engine, timer))
+
+    replace(temporary, file_path)
+
+
+def load(file_path):
+    """ Return a new Engine and timer read from file_path. """
+
+    with open(file_path, 'rb') as snapshot:
+        return loads(snapshot.read())
@@ -0,0 +1,229 @@
+""" Deterministic solver for PySweeper.
+
+Works from what the player can see: the tile shown on
+every revealed plot. It keeps the frontier (revealed
+numbers next to plots it knows nothing about) up to date
+from the Result of every move, and only looks again at
+the constraints a move touched, so a step never rescans
+the board. Deductions are the standard ones:
+ - single plot: a number whose mines are all found makes
+   its other hidden neighbours safe, a number with as many
+   hidden neighbours as missing mines makes them all mines
+ - pairs: two numbers sharing hidden plots, where the
+   difference of their counts settles the plots that only
+   one of them sees
+Like engine, this module does not need pygame.
+"""
+
+import numpy as np
+
+from board import FLAGGED
+from engine import Action, REVEAL, FLAG
+
+
+# Highest tile id that is an adjacent mine count
+MAX_COUNT = 8
+
+
+class Solver():
+    """ Solver following the game in engine. Feed it every
+    Result the engine returns through update(), and call
+    reset() when a new game starts or one is loaded.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.reset()
+
+
+    def reset(self):
+        """ Forget everything and read the board as it is
+        now. This is the only full pass over the board.
+        """
+
+        board = self.engine.board
+
+        self.neighbours_of = board.topology.neighbours_of
+        self.revealed = board.revealed.ravel()
+        self.tiles = board.tiles.ravel()
+
+        # Plots deduced to be mines, and deduced safe
+        # plots that are not revealed yet
+        self.mines = set()
+        self.safe = set()
+        # Known mines that are not flagged yet
+        self.unflagged = set()
+
+        # Revealed numbers next to unknown plots
+        self.frontier = set()
+        # Frontier plots to look at again
+        self.dirty = set(
+            np.flatnonzero(self.revealed & (self.tiles <= MAX_COUNT)).tolist()
+        )
+
+
+    def update(self, result):
+        """ Take in the (index, tile) pairs of result. """
+
+        for index, tile in result.tiles:
+            if tile > MAX_COUNT or not self.revealed[index]:
+                # Marks don't change what is known,
+                # only which mines are left to flag
+                if index in self.mines:
+                    if tile == FLAGGED:
+                        self.unflagged.discard(index)
+                    else:
+                        self.unflagged.add(index)
+                continue
+
+            self.safe.discard(index)
+            self.dirty.add(index)
+            self.__touch(index)
+
+
+    def __touch(self, index):
+        """ Look again at the revealed numbers
+        around the plot at index.
+        """
+
+        for neighbour in self.neighbours_of(index).tolist():
+            if self.revealed[neighbour]:
+                self.dirty.add(neighbour)
+
+
+    def constraint(self, index):
+        """ Return the unknown plots around the number at
+        index and how many mines are among them.
+        """
+
+        unknown = set()
+        mines = int(self.tiles[index])
+
+        for neighbour in self.neighbours_of(index).tolist():
+            if neighbour in self.mines:
+                mines -= 1
+            elif not self.revealed[neighbour] and neighbour not in self.safe:
+                unknown.add(neighbour)
+
+        return unknown, mines
+
+
+    def __mark(self, plots, mine):
+        """ Record every plot in plots as a mine, or as safe. """
+
+        known = self.mines if mine else self.safe
+        flags = self.engine.board.flags.ravel()
+
+        for plot in plots:
+            if plot not in known:
+                known.add(plot)
+                self.__touch(plot)
+                if mine and flags[plot] != 1:
+                    self.unflagged.add(plot)
+
+
+    def solve(self):
+        """ Run the deductions until nothing changes. Return
+        True if any new plot was found safe or mined.
+        """
+
+        found = len(self.mines) + len(self.safe)
+
+        while self.dirty:
+            index = self.dirty.pop()
+
+            if not self.revealed[index] or self.tiles[index] > MAX_COUNT:
+                continue
+
+            unknown, mines = self.constraint(index)
+
+            if not unknown:
+                self.frontier.discard(index)
+                continue
+
+            self.frontier.add(index)
+
+            if mines == 0:
+                self.__mark(unknown, False)
+                continue
+            if mines == len(unknown):
+                self.__mark(unknown, True)
+                continue
+
+            self.__pairs(index, unknown, mines)
+
+        return len(self.mines) + len(self.safe) > found
+
+
+    def __pairs(self, index, unknown, mines):
+        """ Compare the number at index with every frontier
+        number that shares unknown plots with it.
+        """
+
+        others = set()
+
+        for plot in unknown:
+            others.update(self.neighbours_of(plot).tolist())
+
+        others &= self.frontier
+        others.discard(index)
+
+        for other in others:
+            other_unknown, other_mines = self.constraint(other)
+
+            only_here = unknown - other_unknown
+            only_there = other_unknown - unknown
+
+            # Every mine the other number has on top of this
+            # one must be on the plots only it sees. If
+            # there is no room left, they are all mines
+            # and the plots only this one sees are safe
+            for first, second, extra in (
+                (only_here, only_there, other_mines - mines),
+                (only_there, only_here, mines - other_mines),
+            ):
+                if second and extra == len(second):
+                    self.__mark(second, True)
+                    self.__mark(first, False)
+                    self.dirty.update((index, other))
+                    return
+                if not second and extra == 0 and first:
+                    # Subset with the same count
+                    self.__mark(first, False)
+                    self.dirty.update((index, other))
+                    return
+
+
+    def safe_plots(self):
+        """ Return the plots known to be safe but still hidden. """
+
+        self.solve()
+        return set(self.safe)
+
+
+    def mine_plots(self):
+        """ Return the plots known to hold a mine. """
+
+        self.solve()
+        return set(self.mines)
+
+
+    def hint(self):
+        """ Return the next Action a careful player would take:
+        reveal a safe plot, or flag a known mine. Marks in
+        the way are cycled off first. Return None when
+        nothing is certain.
+        """
+
+        self.solve()
+
+        # Lowest index first, so hints are reproducible
+        if self.safe:
+            plot = min(self.safe)
+            flagged = self.engine.board.flags.flat[plot]
+            return Action(FLAG if flagged else REVEAL, plot)
+
+        if self.unflagged:
+            return Action(FLAG, min(self.unflagged))
+
+        return None
@@ -0,0 +1,136 @@
+""" Neighbour tables for PySweeper.
+
+The adjacency relation of a board is built once, as a
+compact CSR style index: plot i's neighbours are
+neighbours[offsets[i]:offsets[i + 1]], all as flat indices.
+Everything that needs adjacency reads from it instead of
+working out offsets on every query.
+"""
+
+import numpy as np
+
+
+class Topology():
+    """ Neighbour table for a square board of terrain_side
+    plots per side.
+     - radius: how far a plot reaches in each direction,
+       1 is the classic 3x3 neighbourhood
+     - wrap: if True, the board is a torus and neighbours
+       wrap around the edges
+    """
+
+    def __init__(self, terrain_side, radius=1, wrap=False):
+        if radius < 1:
+            raise ValueError('Topology radius must be at least 1')
+
+        self.terrain_side = terrain_side
+        self.plot_quantity = terrain_side ** 2
+        self.radius = radius
+        self.wrap = wrap
+
+        # (dx, dy) of every neighbour relative to its plot
+        self.shifts = [
+            (dx, dy)
+            for dy in range(-radius, radius + 1)
+            for dx in range(-radius, radius + 1)
+            if dx or dy
+        ]
+
+        self.offsets, self.neighbours = self.__build()
+
+        # Largest neighbourhood of any plot
+        self.max_degree = int(np.diff(self.offsets).max(initial=0))
+
+
+    def __build(self):
+        """ Return the offsets and neighbours arrays. """
+
+        side = self.terrain_side
+        r = self.radius
+
+        y, x = np.divmod(np.arange(self.plot_quantity), side)
+
+        shifts = self.shifts
+
+        # One column per shift, one row per plot
+        targets = np.empty((self.plot_quantity, len(shifts)), np.int64)
+        valid = np.ones(targets.shape, dtype=bool)
+
+        for column, (dx, dy) in enumerate(shifts):
+            tx = x + dx
+            ty = y + dy
+
+            if self.wrap:
+                tx %= side
+                ty %= side
+            else:
+                valid[:, column] = (
+                    (tx >= 0) & (tx < side)
+                    & (ty >= 0) & (ty < side)
+                )
+
+            targets[:, column] = ty * side + tx
+
+        if self.wrap and side <= 2 * r:
+            # On a torus smaller than the neighbourhood, several
+            # shifts land on the same plot, or on the plot itself
+            for i, row in enumerate(targets):
+                seen = {i}
+                for column, target in enumerate(row):
+                    valid[i, column] = target not in seen
+                    seen.add(target)
+
+        offsets = np.zeros(self.plot_quantity + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=offsets[1:])
+
+        # Row-major masking keeps each plot's neighbours together
+        return offsets, targets[valid].astype(np.int32)
+
+
+    def neighbours_of(self, index):
+        """ Return the flat indices of the neighbours
+        of the plot at flat index.
+        """
+
+        return self.neighbours[
+            self.offsets[index]:self.offsets[index + 1]
+        ]
+
+
+    def count(self, values):
+        """ Return, for every plot, the sum of values (a flat
+        array of one entry per plot) over its neighbours.
+        """
+
+        if self.wrap and self.terrain_side <= 2 * self.radius:
+            # Shifts overlap on tiny tori, only the
+            # deduplicated table gets those right
+            return self._count_table(values)
+
+        side = self.terrain_side
+        grid = values.reshape(side, side)
+        total = np.zeros((side, side), dtype=np.int32)
+
+        # One whole-board add per shift is much cheaper than
+        # gathering every neighbour through the table
+        for dx, dy in self.shifts:
+            if self.wrap:
+                total += np.roll(grid, (-dy, -dx), axis=(0, 1))
+                continue
+
+            ys = slice(max(0, -dy), min(side, side - dy))
+            xs = slice(max(0, -dx), min(side, side - dx))
+            total[ys, xs] += grid[
+                ys.start + dy:ys.stop + dy, xs.start + dx:xs.stop + dx
+            ]
+
+        return total.ravel()
+
+
+    def _count_table(self, values):
+        """ count(), going through the neighbour table. """
+
+        gathered = np.cumsum(values[self.neighbours], dtype=np.int64)
+        gathered = np.concatenate(([0], gathered))
+
+        return gathered[self.offsets[1:]] - gathered[self.offsets[:-1]]